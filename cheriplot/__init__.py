@@ -1,5 +1,8 @@
 import os
 import matplotlib
+
+__version__ = "2.0"
+
 # set the default backend here
 if "DISPLAY" in os.environ:
     matplotlib.use("qt5agg")
@@ -27,7 +27,6 @@
 
 import logging
 
-from matplotlib import pyplot as plt
 from graph_tool.all import *
 
 from cheriplot.core import ConfigurableComponent, Option
@@ -49,6 +48,7 @@ class CallGraphPlot(ConfigurableComponent):
         self.fig, self.ax = self.init_axes()
 
     def init_axes(self):
+        from matplotlib import pyplot as plt
         plt.switch_backend("cairo")
         fig = plt.figure(figsize=(15,10))
         ax = fig.add_axes([0.05, 0.15, 0.9, 0.80,])
@@ -74,5 +74,5 @@ class CallGraphPlot(ConfigurableComponent):
                    vertex_text=label,
                    vertex_text_position=-1,
                    edge_pen_width=pen_width)
-        plt.savefig(self.config.outfile)
+        self.fig.savefig(self.config.outfile)
         print("Written file %s" % self.config.outfile)
@@ -37,7 +37,7 @@ import pycheritrace as pct
 import sys
 
 from cached_property import cached_property
-from collections import defaultdict
+from collections import defaultdict, deque
 from enum import Enum
 from functools import reduce, partial
 from itertools import chain
@@ -325,8 +325,14 @@ class Instruction:
             return False
         return self._prev_inst.has_delay_slot
 
-    @property
+    @cached_property
     def has_exception(self):
+        """
+        This instruction raised an exception?
+        The value is cached because it is checked by the callback dispatch
+        and again by most of the callbacks for the same entry.
+        """
+        # exception code 31 means that there is no exception
         return self.entry.exception != 31
 
     def __str__(self):
@@ -370,6 +376,10 @@ class IClass(Enum):
     """Generic capability instruction."""
 
 
+_iclass_by_name = {iclass.value: iclass for iclass in IClass}
+"""Map callback names to the instruction class they refer to."""
+
+
 class CallbacksManager:
     """
     Gather callbacks from CallbackTraceParser and
@@ -395,6 +405,14 @@ class CallbacksManager:
         registered to handle it.
         """
 
+        self._dispatch = {}
+        """
+        Dispatch table, map the instruction mnemonic to the tuple
+        of callbacks to invoke for an instruction that does not
+        access memory, is not in a delay slot and does not cause an
+        exception. This is filled lazily during the parse loop.
+        """
+
     def gather_callbacks(self, obj):
         """
         Fetch callbacks defined in the given object.
@@ -423,16 +441,17 @@ class CallbacksManager:
                 continue
             # remove the scan_ prefix
             cbk_name = attr[5:]
-            for iclass in IClass:
-                if cbk_name == iclass.value:
-                    # add the iclass callback for all the
-                    # instructions in such class
-                    opcodes = self.iclass_map.get(iclass, [])
-                    for opcode in opcodes:
-                        self._callbacks[opcode].append(method)
-                    break
+            iclass = _iclass_by_name.get(cbk_name)
+            if iclass is not None:
+                # add the iclass callback for all the
+                # instructions in such class
+                opcodes = self.iclass_map.get(iclass, [])
+                for opcode in opcodes:
+                    self._callbacks[opcode].append(method)
             else:
                 self._callbacks[cbk_name].append(method)
+        # the dispatch table is stale
+        self._dispatch = {}
         logger.debug("CallbackManager loaded callbacks:\n%s",
                      self._dbg_repr_callbacks())
 
@@ -449,6 +468,22 @@ class CallbacksManager:
             self._callbacks.items())
         return reduce(lambda p,a: "%s\n%s" % (a, p), pairs, "")
 
+    def get_opcode_callbacks(self, opcode):
+        """
+        Return the callbacks for an instruction that does not access
+        memory, is not in a delay slot and does not cause an exception.
+
+        :param opcode: the instruction mnemonic
+        :return: tuple of methods to be called
+        """
+        try:
+            return self._dispatch[opcode]
+        except KeyError:
+            cbks = (tuple(self._callbacks.get(opcode, [])) +
+                    tuple(self._callbacks.get("all", [])))
+            self._dispatch[opcode] = cbks
+            return cbks
+
     def get_callbacks(self, inst):
         """
         Return a list of callback methods that should be called to
@@ -459,15 +494,23 @@ class CallbacksManager:
         :return: list of methods to be called
         :rtype: list of callables
         """
+        entry = inst.entry
+        is_load = entry.is_load
+        is_store = entry.is_store
+        in_delay_slot = inst.in_delay_slot
+        has_exception = inst.has_exception
+        if not (is_load or is_store or in_delay_slot or has_exception):
+            # common case, use the precomputed table
+            return self.get_opcode_callbacks(inst.opcode)
         # the <all> callback should be the last one executed
         cbks = [self._callbacks[inst.opcode]]
-        if inst.entry.is_load:
+        if is_load:
             cbks.append(self._callbacks["mem_load"])
-        if inst.entry.is_store:
+        if is_store:
             cbks.append(self._callbacks["mem_store"])
-        if inst.in_delay_slot:
+        if in_delay_slot:
             cbks.append(self._callbacks["delay_slot"])
-        if inst.has_exception:
+        if has_exception:
             cbks.append(self._callbacks["exception"])
         cbks.append(self._callbacks["all"])
         return chain(*cbks)
@@ -584,6 +627,16 @@ class CallbackTraceParser(TraceParser):
         # _scan call is too expensive
         progress_points = list(range(start, end, int((end - start) / 100) + 1))
         progress_points.append(end)
+        # bind the objects used for every entry to closure locals
+        # to avoid repeated attribute lookups in the scan loop
+        disassemble = self._dis.disassemble
+        get_callbacks = self._cbk_manager.get_callbacks
+        get_opcode_callbacks = self._cbk_manager.get_opcode_callbacks
+        instruction_class = Instruction
+        # the disassembly depends only on the instruction encoding and
+        # the trace executes the same instructions over and over, so
+        # each encoding is disassembled once
+        disasm_cache = {}
 
         def _scan(entry, regs, idx):
             if idx >= progress_points[0]:
@@ -593,20 +646,46 @@ class CallbackTraceParser(TraceParser):
                 self.cycles_start = entry.cycles
             elif end == idx:
                 self.cycles_end = entry.cycles
-            disasm = self._dis.disassemble(entry.inst)
+            encoding = entry.inst
             try:
-                if self._last_regs is None:
+                disasm, opcode = disasm_cache[encoding]
+            except KeyError:
+                disasm = disassemble(encoding)
+                name_parts = disasm.name.split("\t")
+                opcode = name_parts[1] if len(name_parts) > 1 else None
+                disasm_cache[encoding] = (disasm, opcode)
+            last_instr = self._last_instr
+            # most instructions have no callbacks at all, skip them
+            # before building the instruction and its operands.
+            # In the common case the dispatch table entry found here
+            # is used directly for the callback loop.
+            cbks = None
+            if (opcode is not None and
+                not (entry.is_load or entry.is_store) and
+                entry.exception == 31 and
+                (last_instr is None or not last_instr.has_delay_slot)):
+                cbks = get_opcode_callbacks(opcode)
+                if not cbks:
+                    self._last_instr = disasm
                     self._last_regs = regs
-                inst = Instruction(disasm, entry, regs, self._last_regs, self._last_instr)
+                    return False
+            last_regs = self._last_regs
+            try:
+                if last_regs is None:
+                    last_regs = self._last_regs = regs
+                inst = instruction_class(disasm, entry, regs, last_regs,
+                                         self._last_instr)
                 self._last_instr = disasm
             except Exception as e:
                 self._last_instr = disasm
-                return self._parse_exception(e, entry, nregs, disasm, idx)
+                return self._parse_exception(e, entry, regs, disasm, idx)
 
+            if cbks is None:
+                cbks = get_callbacks(inst)
             ret = False
             try:
-                for cbk in self._cbk_manager.get_callbacks(inst):
-                    ret |= cbk(inst, entry, regs, self._last_regs, idx)
+                for cbk in cbks:
+                    ret |= cbk(inst, entry, regs, last_regs, idx)
                     if ret:
                         break
             except Exception as e:
@@ -643,7 +722,7 @@ class MultiprocessCallbackParser(CallbackTraceParser):
             self.pool = None
             """Subprocess pool."""
 
-            self.results = []
+            self.results = deque()
             """Async results."""
 
 
@@ -694,6 +773,9 @@ class MultiprocessCallbackParser(CallbackTraceParser):
     def mp_merge(self, results):
         """
         Merge partial results from workers.
+
+        :param results: iterable of the worker results in trace order,
+        results are fetched lazily while the workers are running.
         """
         return
 
@@ -740,19 +822,26 @@ class MultiprocessCallbackParser(CallbackTraceParser):
             result = self.mp.pool.apply_async(
                     MultiprocessCallbackParser._run_worker, args)
             self.mp.results.append(result)
-            # wait for all workers to finish
         self.mp.pool.close()
-        self.mp.pool.join()
-        # propagate exceptions and fetch results
-        results = []
-        for r in self.mp.results:
-            results.append(r.get())
-        # free memory
-        del self.mp.results
-
-        # we don't need the pool anymore, kill anything that may
-        # be still there
-        self.mp.pool.terminate()
-        del self.mp.pool
-        # merge partial results
-        self.mp_merge(results)
+        try:
+            # merge partial results in order as soon as they are
+            # available, so that the merge overlaps with the workers
+            # that are still running
+            self.mp_merge(self._iter_mp_results())
+            self.mp.pool.join()
+        finally:
+            # we don't need the pool anymore, kill anything that may
+            # be still there
+            self.mp.pool.terminate()
+            del self.mp.pool
+
+    def _iter_mp_results(self):
+        """
+        Fetch the worker results in order, waiting for each one to
+        be ready. Exceptions raised in the workers are propagated here.
+        The results are dropped from the multiprocessing state once they
+        are fetched so that the memory is released after each merge step.
+        """
+        results = self.mp.results
+        while results:
+            yield results.popleft().get()
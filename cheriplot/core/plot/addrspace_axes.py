@@ -29,13 +29,13 @@ import numpy as np
 import logging
 import sys
 
-from matplotlib import pyplot as plt
-from matplotlib import transforms, axes, scale, axis, lines
+from matplotlib import transforms, axes, scale, axis
+from matplotlib.collections import LineCollection
 from matplotlib.projections import register_projection
 from matplotlib.ticker import Formatter, Locator
 
 from operator import attrgetter, itemgetter
-from sortedcontainers import SortedDict, SortedListWithKey
+from sortedcontainers import SortedDict
 
 from cheriplot.core.plot.label_manager import LabelManager
 
@@ -105,33 +105,17 @@ class AddressSpaceCollapseTransform(transforms.Transform):
         """
         Given a set of intervals [(start, end), ...] merge the overlapping
         intervals.
-        This is O(n*log(n)) but if all goes well is only done once for every
-        plot.
+        This is a single sort followed by a linear scan, O(n*log(n)),
+        and if all goes well is only done once for every plot.
         """
-        merged = SortedListWithKey(intervals, key=lambda k: (k[0], k[1]))
         out = []
-        if len(merged) == 0:
-            return out
-        curr = merged[0]
-        idx = 1
-        while idx < len(merged):
-            to_merge = merged[idx]
-            if to_merge[0] > curr[1]:
-                # we are done with to_merge
-                out.append(curr)
-                curr = to_merge
+        for start, end in sorted(intervals, key=itemgetter(0, 1)):
+            if out and start <= out[-1][1]:
+                # overlapping or adjacent to the current interval
+                if end > out[-1][1]:
+                    out[-1] = (out[-1][0], end)
             else:
-                curr = (curr[0], to_merge[1])
-            end_idx = merged.bisect((curr[1], np.inf))
-            idx = end_idx
-            if end_idx == len(merged):
-                end_idx -= 1
-            if merged[end_idx][0] <= curr[1]:
-                end = max(curr[1], merged[end_idx][1])
-            else:
-                end = max(curr[1], merged[end_idx - 1][1])
-            curr = (curr[0], end)
-        out.append(curr)
+                out.append((start, end))
         logger.debug("Merge collapse ranges (remaining %d)", len(out))
         return out
 
@@ -372,23 +356,18 @@ scale.register_scale(AddressSpaceScale)
 
 class AddressSpaceXTick(axis.XTick):
 
-    def _get_ticklabel_line(self):
+    def _get_ticklabel_segment(self):
+        """
+        Return the segment joining the tick to the label
+        in display coordinates.
+        The segments are drawn by the axis in a single collection.
+        """
         axis_trans = self.axes.get_xaxis_transform(which="tick1")
         text_trans = self._get_text1_transform()[0]
         tick_position = axis_trans.transform((self.tick1line.get_xdata()[0],
                                               self.tick1line.get_ydata()[0]))
         label_position = text_trans.transform(self.label1.get_position())
-        x = (tick_position[0], label_position[0])
-        y = (tick_position[1], label_position[1])
-        line = lines.Line2D(x, y, linestyle="solid", color="black")
-        return line
-
-    # @allow_rasterization
-    def draw(self, renderer):
-        super(AddressSpaceXTick, self).draw(renderer)
-
-        line = self._get_ticklabel_line()
-        line.draw(renderer)
+        return (tick_position, label_position)
 
 
 class AddressSpaceXAxis(axis.XAxis):
@@ -401,6 +380,9 @@ class AddressSpaceXAxis(axis.XAxis):
 
         self.label_manager = LabelManager
 
+        self._ticks_to_draw = []
+        """Ticks drawn in the last update, used to draw the label lines."""
+
     def _get_tick(self, major):
         """
         Force labels to be vertical
@@ -420,8 +402,20 @@ class AddressSpaceXAxis(axis.XAxis):
         mgr = self.label_manager(direction="h")
         mgr.add_labels([t.label1 for t in ticks])
         mgr.update_label_position(renderer)
+        self._ticks_to_draw = ticks
         return ticks
 
+    def draw(self, renderer, *args, **kwargs):
+        super(AddressSpaceXAxis, self).draw(renderer, *args, **kwargs)
+        if not self.get_visible() or not self._ticks_to_draw:
+            return
+        # draw the tick-to-label lines in one batch instead of
+        # building a Line2D for every tick
+        segments = [t._get_ticklabel_segment() for t in self._ticks_to_draw]
+        lines = LineCollection(segments, colors="black", linestyle="solid",
+                               transform=transforms.IdentityTransform())
+        lines.draw(renderer)
+
     def _get_pixel_distance_along_axis(self, where, perturb):
         """
         Like the polar plot it is not meaningful
@@ -34,7 +34,6 @@ from functools import reduce
 from operator import methodcaller, itemgetter
 from sortedcontainers import SortedDict
 
-from matplotlib import pyplot as plt
 from matplotlib.transforms import Bbox
 
 from cheriplot.core.utils import ProgressTimer
@@ -214,6 +213,9 @@ class BasePlotBuilder:
 
         :return: tuple containing the figure and the axes
         """
+        # pyplot is imported only when a figure is needed, the import
+        # is slow and sets up the backend
+        from matplotlib import pyplot as plt
         fig = plt.figure(**self._get_figure_kwargs())
         rect = self._get_axes_rect()
         ax = fig.add_axes(rect, **self._get_axes_kwargs())
@@ -309,15 +311,19 @@ class BasePlotBuilder:
             self.ax.set_yticklabels(self._yticks.values(),
                                     **self._get_ylabels_kwargs())
 
-    def process(self, out_file=None, show=True):
+    def process(self, out_file=None, show=None):
         """
         Produce the plot and display it or write it to a file
 
         :param out_file: output file path
         :type out_file: str
-        :param show: show the plot in an interactive window
+        :param show: show the plot in an interactive window, by default
+        the plot is shown only if it is not written to a file, so that
+        batch runs do not block in the GUI backend main loop.
         :type show: bool
         """
+        if show is None:
+            show = not out_file
         with ProgressTimer("Plot builder processing", logger):
             self.make_patches()
             self.make_plot()
@@ -326,6 +332,7 @@ class BasePlotBuilder:
             if show:
                 # the fig.show() method does not enter the backend main loop
                 # self.fig.show()
+                from matplotlib import pyplot as plt
                 plt.show()
 
     def register_patch_builder(self, dataset, builder):
@@ -28,8 +28,6 @@
 import sys
 import os
 import logging
-import cProfile
-import pstats
 import shlex
 import readline
 
@@ -99,8 +97,10 @@ class BaseToolTaskDriver(TaskDriver):
         }
         logging.basicConfig(**logging_args)
 
-        # instrument the run method to do profiling
+        # instrument the run method to do profiling,
+        # the profiler is only imported when it is used
         if self.config.profile:
+            import cProfile
             run_method = self.run
             def profiling_run():
                 try:
@@ -70,8 +70,15 @@ class ProgressPrinter:
         """Log level"""
 
     def advance(self, step=1, to=None):
-        if logger.getEffectiveLevel() > self.level:
-            return
+        """
+        Advance the progress counter.
+        This is called in hot loops so the log level is checked only
+        when the percentage changes. Callers can also accumulate
+        the counter locally and advance by a larger step.
+
+        :param step: counter increment
+        :param to: set the counter to the given value instead
+        """
         if to is not None:
             self.curr = to
         else:
@@ -82,6 +89,8 @@ class ProgressPrinter:
         progress = int(self.curr * 100 / (self.end - self.start))
         if (progress != self.progress):
             self.progress = progress
+            if logger.getEffectiveLevel() > self.level:
+                return
             sys.stdout.write("\r%s [%d%%]" % (self.desc, progress))
             sys.stdout.flush()
             
@@ -130,16 +139,26 @@ class ProgressManager(Thread):
         """Log level"""
 
     def advance(self, step=1):
-        if logger.getEffectiveLevel() > self._level:
-            return
+        """
+        Advance the progress counter.
+        The counter may be advanced from multiple threads (e.g. the
+        merge of the worker results), so the update is locked.
+        This is called for every vertex or edge of a graph visit,
+        the log level is checked by the reporting thread instead.
+
+        :param step: counter increment
+        """
         with self._lock:
             self._progress += step
 
     def report(self):
+        if logger.getEffectiveLevel() > self._level:
+            return
         with self._lock:
-            progress = int(self._progress * 100 / (self._end - self._start))
+            curr = self._progress
+        progress = int(curr * 100 / (self._end - self._start))
         sys.stdout.write("\r{} [{:d}%] ({:d}/{:d})".format(
-            self._desc, progress, self._progress, self._end))
+            self._desc, progress, curr, self._end))
         sys.stdout.flush()
 
     def run(self):
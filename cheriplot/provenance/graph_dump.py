@@ -218,26 +218,35 @@ class ProvenanceGraphDumpDriver(BaseToolTaskDriver):
             return self._check_limits(start, end, vdata.pc)
         return None
 
+    def _match_event_addr(self, vdata, mask, start, end):
+        """
+        Check whether any event of the given type in the vertex event
+        table has an address within the given limits.
+        The packed event columns are converted to arrays and matched
+        in a single vectorized comparison.
+        """
+        dtypes = ProvenanceVertexData._event_dtypes
+        types = np.array(vdata.events["type"], dtype=dtypes["type"])
+        addrs = np.array(vdata.events["addr"], dtype=dtypes["addr"])
+        match = (types & int(mask)) != 0
+        if start is not None:
+            match &= addrs >= start
+        if end is not None:
+            match &= addrs <= end
+        return bool(np.any(match))
+
     def _match_mem(self, edge, vdata):
         if self.config.mem:
             start, end = self.config.mem
-            result = False
-            for addr in vdata.address["addr"]:
-                result |= self._check_limits(start, end, addr)
-                if result:
-                    break
-            return result
+            return self._match_event_addr(
+                vdata, EventType.memop_mask(), start, end)
         return None
 
     def _match_deref(self, edge, vdata):
         if self.config.deref:
             start, end = self.config.deref
-            result = False
-            for addr in vdata.deref["addr"]:
-                result |= self._check_limits(start, end, addr)
-                if result:
-                    break
-            return result
+            return self._match_event_addr(
+                vdata, EventType.deref_mask(), start, end)
         return None
 
     def _match_perms(self, edge, vdata):
@@ -309,13 +318,12 @@ class ProvenanceGraphDumpDriver(BaseToolTaskDriver):
         str_vertex.write("} ")
 
         # Dump event table
-        events = vdata.event_tbl
-        n_load = (events["type"] & EventType.DEREF_LOAD).sum()
-        n_store = (events["type"] & EventType.DEREF_STORE).sum()
+        n_load = vdata.count_events(EventType.DEREF_LOAD)
+        n_store = vdata.count_events(EventType.DEREF_STORE)
         str_vertex.write(
             "deref-load:{:d} deref-store:{:d} ".format(n_load, n_store))
-        n_loaded = (events["type"] & EventType.LOAD).sum()
-        n_stored = (events["type"] & EventType.STORE).sum()
+        n_loaded = vdata.count_events(EventType.LOAD)
+        n_stored = vdata.count_events(EventType.STORE)
         str_vertex.write("load:{:d} store:{:d}".format(n_loaded, n_stored))
 
         # Display symbol name
@@ -422,10 +430,10 @@ class ProvenanceGraphDumpDriver(BaseToolTaskDriver):
         Get the parent vertex in the given layer and the connecting
         edge.
         """
-        parents = list(v.in_neighbours())
-        if len(parents) == 0:
+        if v.in_degree() == 0:
             return None, None
-        return parents[0], view.edge(parents[0], v)
+        parent = next(v.in_neighbours())
+        return parent, view.edge(parent, v)
 
     def _dump_layer(self, view):
         for v in view.vertices():
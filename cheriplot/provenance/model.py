@@ -31,10 +31,10 @@ Provenance graph implementation and helper classes.
 
 import os
 import logging
+from array import array
 from enum import IntEnum, IntFlag, auto
 from functools import partialmethod
 from collections import OrderedDict
-from contextlib import suppress
 
 import numpy as np
 import pandas as pd
@@ -98,6 +98,13 @@ class CheriCap:
 
     MAX_OTYPE = 0x00ffffff
 
+    __slots__ = ("base", "length", "offset", "permissions", "objtype",
+                 "valid", "sealed", "t_alloc", "t_free")
+    """
+    There is a capability object for each vertex in the provenance layer,
+    slots keep them compact and the field access fast.
+    """
+
     @classmethod
     def from_copy(cls, other):
         """Create a copy of a CheriCap."""
@@ -149,6 +156,22 @@ class CheriCap:
         self.t_free = -1
         """Free time"""
 
+    def __getstate__(self):
+        """
+        Pickle the fields as a dict, this is the same format used before
+        the slots were introduced so existing graphs can still be loaded.
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        """
+        Restore the fields from the pickled dict.
+        Unknown keys from older layouts are ignored.
+        """
+        for name in self.__slots__:
+            if name in state:
+                setattr(self, name, state[name])
+
     @property
     def bound(self):
         """Convenience property to get base + length."""
@@ -258,7 +281,18 @@ class EventType(IntFlag):
         """
         return (cls.DEREF_LOAD | cls.DEREF_STORE |
                 cls.DEREF_CALL | cls.DEREF_IS_CAP)
-    
+
+# event flags combined and tested for every recorded event,
+# plain ints avoid the IntFlag operators
+_EVENT_LOAD = int(EventType.LOAD)
+_EVENT_STORE = int(EventType.STORE)
+_EVENT_DEREF_LOAD = int(EventType.DEREF_LOAD)
+_EVENT_DEREF_STORE = int(EventType.DEREF_STORE)
+_EVENT_DEREF_CALL = int(EventType.DEREF_CALL)
+_EVENT_DEREF_IS_CAP = int(EventType.DEREF_IS_CAP)
+_EVENT_DELETE = int(EventType.DELETE)
+_EVENT_USR = int(EventType.USR)
+
 
 class ProvenanceVertexData:
     """
@@ -286,9 +320,11 @@ class ProvenanceVertexData:
 
     def __init__(self):
 
-        self.events = {"time": [], "addr": [], "type": []}
+        self.events = {key: array(typecode) for key, typecode in
+                       self._event_typecodes.items()}
         """
-        Event table. This is initialised as a fast-append structure.
+        Event table. This is initialised as a fast-append structure,
+        each column is a packed array of machine integers.
         It will be transformed to a DataFrame for fast indexing/update
         when the parsing finishes.
         """
@@ -312,6 +348,70 @@ class ProvenanceVertexData:
         self._active_memory = {}
         """Map active memory addresses to rows in the events table."""
 
+    _event_dtypes = {"time": np.int64, "addr": np.uint64, "type": np.uint8}
+    """
+    Packed dtype of each column in the event table.
+    The time is signed, as the capability t_alloc, because the merge
+    may shift the event times by a negative offset.
+    The EventType flags fit in a byte, widen the type column if
+    more flags are added.
+    """
+
+    _event_typecodes = {"time": "q", "addr": "Q", "type": "B"}
+    """Array typecode of each column in the event table, see _event_dtypes."""
+
+    def __getstate__(self):
+        """
+        Pack the event table columns in numpy arrays when pickling,
+        this is much more compact than lists of python ints.
+        The cached event DataFrame is dropped, it is rebuilt on demand.
+        """
+        state = dict(self.__dict__)
+        state.pop("event_tbl", None)
+        state["events"] = {
+            key: np.array(self.events[key], dtype=dtype)
+            for key, dtype in self._event_dtypes.items()}
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restore the fast-append event table from the packed columns.
+        Graphs saved before the event table was packed use the default
+        pickle layout, see :meth:`_upgrade_legacy_state`.
+        """
+        state = dict(state)
+        events = state["events"]
+        if any(not isinstance(col, np.ndarray) for col in events.values()):
+            state = self._upgrade_legacy_state(state)
+            events = state["events"]
+        state["events"] = {}
+        for key, col in events.items():
+            typecode = self._event_typecodes[key]
+            if isinstance(col, np.ndarray):
+                col = col.astype(self._event_dtypes[key], copy=False).tobytes()
+            state["events"][key] = array(typecode, col)
+        self.__dict__.update(state)
+
+    @staticmethod
+    def _upgrade_legacy_state(state):
+        """
+        Convert the state of a graph saved before the event table was
+        packed. The events are a dict of lists of python ints, the
+        pickle may contain the cached event DataFrame and graphs older
+        than the active_memory alias store the map without the underscore.
+
+        :param state: the unpickled instance dict
+        :return: the state in the packed-array layout
+        """
+        # the cached table was built with the old column dtypes
+        state.pop("event_tbl", None)
+        if "active_memory" in state:
+            state["_active_memory"] = state.pop("active_memory")
+        state.setdefault("_active_memory", {})
+        state["events"] = {key: list(col) for key, col in
+                           state["events"].items()}
+        return state
+
     @property
     def active_memory(self):
         """XXX temporary alias to avoid rebuilding existin graphs."""
@@ -337,25 +437,37 @@ class ProvenanceVertexData:
         In general the mutable structure is used during graph construction,
         the dataframe is used during graph postprocessing.
         """
-        df = pd.DataFrame(self.events)
-        df = df.astype({"time": "u8", "addr": "u8", "type": "u4"}, copy=False)
+        df = pd.DataFrame({key: np.array(self.events[key], dtype=dtype)
+                           for key, dtype in self._event_dtypes.items()})
         return df
 
+    def shift_event_time(self, delta):
+        """
+        Offset the time of all the events.
+
+        :param delta: time offset
+        """
+        times = self.events["time"]
+        shifted = (t + delta for t in times)
+        if isinstance(times, array):
+            shifted = array(times.typecode, shifted)
+        times[:] = shifted
+
     def add_event(self, time, addr, is_kernel, type_):
         """Append an event to the event table."""
         if not is_kernel:
-            type_ |= ProvenanceVertexData.EventType.USR
-        self.events["time"].append(time)
-        self.events["addr"].append(addr)
-        self.events["type"].append(type_)
+            type_ |= _EVENT_USR
+        events = self.events
+        times = events["time"]
+        times.append(time)
+        events["addr"].append(addr)
+        events["type"].append(type_)
         # invalidate cached property
-        with suppress(KeyError):
-            del self.__dict__["event_tbl"]
-        if (type_ & ProvenanceVertexData.EventType.STORE):
-            self._active_memory[addr] = len(self.events["time"]) - 1
-        elif (type_ & ProvenanceVertexData.EventType.DELETE):
-            with suppress(KeyError):
-                del self._active_memory[addr]
+        self.__dict__.pop("event_tbl", None)
+        if (type_ & _EVENT_STORE):
+            self._active_memory[addr] = len(times) - 1
+        elif (type_ & _EVENT_DELETE):
+            self._active_memory.pop(addr, None)
 
     def add_deref(self, time, addr, pc, cap, type_):
         """
@@ -368,9 +480,22 @@ class ProvenanceVertexData:
         see :class:`EventType`
         """
         if cap:
-            type_ |= ProvenanceVertexData.EventType.DEREF_IS_CAP
+            type_ |= _EVENT_DEREF_IS_CAP
         self.add_event(time, addr, pc, type_)
 
+    def count_events(self, mask):
+        """
+        Count the events that have any of the given type flags set.
+        The flags of all the events are tested in a single vectorized
+        pass.
+
+        :param mask: :class:`EventType` flags to match
+        :return: number of matching events
+        """
+        event_types = np.array(self.events["type"],
+                               dtype=self._event_dtypes["type"])
+        return int(np.count_nonzero(event_types & int(mask)))
+
     def get_active_memory(self):
         """
         Return a list of memory addresses where the vertex is
@@ -387,14 +512,14 @@ class ProvenanceVertexData:
         return len(self.active_memory) > 0
 
     # shortcuts for mem-op events
-    add_mem_load = partialmethod(add_event, type_=EventType.LOAD)
-    add_mem_store = partialmethod(add_event, type_=EventType.STORE)
-    add_mem_del = partialmethod(add_event, type_=EventType.DELETE)
+    add_mem_load = partialmethod(add_event, type_=_EVENT_LOAD)
+    add_mem_store = partialmethod(add_event, type_=_EVENT_STORE)
+    add_mem_del = partialmethod(add_event, type_=_EVENT_DELETE)
 
     # shortcuts for dereference events
-    add_deref_load = partialmethod(add_deref, type_=EventType.DEREF_LOAD)
-    add_deref_store = partialmethod(add_deref, type_=EventType.DEREF_STORE)
-    add_deref_call = partialmethod(add_deref, type_=EventType.DEREF_CALL)
+    add_deref_load = partialmethod(add_deref, type_=_EVENT_DEREF_LOAD)
+    add_deref_store = partialmethod(add_deref, type_=_EVENT_DEREF_STORE)
+    add_deref_call = partialmethod(add_deref, type_=_EVENT_DEREF_CALL)
 
     def __str__(self):
         return "%s origin:%s pc:0x%x kernel:%d" % (
@@ -583,6 +708,110 @@ class ProvenanceGraphManager:
         self.edge_addr = self.graph.ep.addr
         self.edge_regs = self.graph.ep.regs
         self.stack_capability = self.graph.gp.stack
+        # the graph changed, drop the vertex arrays of the previous one
+        self._vertex_arrays = None
+
+    def __getstate__(self):
+        """
+        Pickle only the graph when the manager is sent between processes.
+        The property shorthands would serialize each property map
+        values again, in addition to the copy stored in the graph itself,
+        so they are rebuilt from the graph when unpickling.
+        """
+        return {"outfile": self.outfile, "graph": self.graph}
+
+    def __setstate__(self, state):
+        """Restore the graph and the property shorthands."""
+        self.outfile = state["outfile"]
+        self.graph = state["graph"]
+        self._init_props()
+
+    def vertex_arrays(self, graph_view=None):
+        """
+        Extract the capability fields of the provenance vertices
+        as a set of numpy arrays indexed by vertex index.
+
+        The arrays span the whole graph, vertices that are not part of
+        the provenance layer or are filtered out of the given view
+        are marked False in the "layer_prov" array and their fields
+        should not be used.
+        The base, length and pc fields may be None, these are stored as 0
+        and the "has_base", "has_length" and "has_pc" arrays are False.
+
+        The fields are extracted once and cached in the manager, the
+        arrays are read-only and shared between the callers.
+        The cache is rebuilt when the provenance layer grows, the vertex
+        data modified in place requires :meth:`invalidate_vertex_arrays`.
+
+        :param graph_view: restrict the "layer_prov" array to the vertices
+        in the given view, defaults to the whole graph
+        :return: dict of :class:`numpy.ndarray`
+        """
+        n_vertices = self.graph.num_vertices(ignore_filter=True)
+        layer_prov = self.layer_prov.get_array()[:n_vertices].astype(bool)
+        cached = self._vertex_arrays
+        if (cached is None or len(cached["layer_prov"]) != n_vertices or
+            (layer_prov & ~cached["layer_prov"]).any()):
+            cached = self._vertex_arrays = self._extract_vertex_arrays(
+                layer_prov)
+        arrays = dict(cached)
+        if graph_view is not None:
+            in_view = np.zeros(n_vertices, dtype=bool)
+            in_view[graph_view.get_vertices()] = True
+            layer_prov &= in_view
+        arrays["layer_prov"] = layer_prov
+        return arrays
+
+    def invalidate_vertex_arrays(self):
+        """
+        Drop the cached vertex arrays, this must be called when the
+        capability fields of existing vertices are modified.
+        Graph visits that set :attr:`GraphVisitBase.modifies_vertex_data`
+        call this when they complete.
+        """
+        self._vertex_arrays = None
+
+    def _extract_vertex_arrays(self, layer_prov):
+        """
+        Build the field arrays for the given provenance layer vertices.
+
+        :param layer_prov: boolean array of the vertices to extract
+        :return: dict of read-only :class:`numpy.ndarray`
+        """
+        n_vertices = len(layer_prov)
+        arrays = {
+            "layer_prov": layer_prov.copy(),
+            "base": np.zeros(n_vertices, dtype=np.uint64),
+            "has_base": np.zeros(n_vertices, dtype=bool),
+            "length": np.zeros(n_vertices, dtype=np.uint64),
+            "has_length": np.zeros(n_vertices, dtype=bool),
+            "permissions": np.zeros(n_vertices, dtype=np.int64),
+            "valid": np.zeros(n_vertices, dtype=bool),
+            "t_alloc": np.zeros(n_vertices, dtype=np.int64),
+            "origin": np.zeros(n_vertices, dtype=np.int32),
+            "pc": np.zeros(n_vertices, dtype=np.uint64),
+            "has_pc": np.zeros(n_vertices, dtype=bool),
+            "is_kernel": np.zeros(n_vertices, dtype=bool),
+        }
+        for idx in np.flatnonzero(layer_prov):
+            data = self.data[idx]
+            if data.cap.base is not None:
+                arrays["base"][idx] = data.cap.base
+                arrays["has_base"][idx] = True
+            if data.cap.length is not None:
+                arrays["length"][idx] = data.cap.length
+                arrays["has_length"][idx] = True
+            arrays["permissions"][idx] = data.cap.permissions or 0
+            arrays["valid"][idx] = data.cap.valid
+            arrays["t_alloc"][idx] = data.cap.t_alloc
+            arrays["origin"][idx] = data.origin
+            if data.pc is not None:
+                arrays["pc"][idx] = data.pc
+                arrays["has_pc"][idx] = True
+            arrays["is_kernel"][idx] = data.is_kernel
+        for values in arrays.values():
+            values.flags.writeable = False
+        return arrays
 
     def prov_view(self):
         """Provenance graph layer."""
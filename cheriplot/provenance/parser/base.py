@@ -33,7 +33,10 @@ architecture-specific subparsers and multiprocessing parsing.
 
 import logging
 import os
+import numpy as np
 from functools import partial
+from collections import Counter
+from multiprocessing.reduction import ForkingPickler
 
 from cheriplot.core import ProgressTimer, MultiprocessCallbackParser
 from cheriplot.provenance.model import (
@@ -43,6 +46,10 @@ from .error import *
 
 logger = logging.getLogger(__name__)
 
+# origin values compared in the parser and merge hot paths
+_ORIGIN_ROOT = int(CheriNodeOrigin.ROOT)
+_ORIGIN_PARTIAL = int(CheriNodeOrigin.PARTIAL)
+
 class VertexMemoryMap:
     """
     Helper object that keeps track of the graph vertex associated
@@ -63,6 +70,26 @@ class VertexMemoryMap:
         self.pgm = pgm
         """Graph manager."""
 
+    @staticmethod
+    def _pack_map(vmap):
+        """
+        Convert an address to vertex map to a pair of address and
+        vertex index arrays.
+        The arrays are pickled as contiguous buffers, this is much
+        smaller and faster to transfer than the dict of python ints.
+        """
+        n_items = len(vmap)
+        addrs = np.fromiter(vmap.keys(), dtype=np.uint64, count=n_items)
+        vertices = np.fromiter(map(int, vmap.values()), dtype=np.int64,
+                               count=n_items)
+        return (addrs, vertices)
+
+    @staticmethod
+    def _unpack_map(packed):
+        """Rebuild an address to vertex index map from the packed arrays."""
+        addrs, vertices = packed
+        return dict(zip(addrs.tolist(), vertices.tolist()))
+
     def __getstate__(self):
         """
         Make object pickle-able, the graph-tool vertices index are used
@@ -71,8 +98,8 @@ class VertexMemoryMap:
         logger.debug("Pickling partial result vertex-memory map %d",
                      os.getpid())
         state = {
-            "vertex_map": {k: int(v) for k,v in self.vertex_map.items()},
-            "initial_map": {k: int(v) for k,v in self.initial_map.items()}
+            "vertex_map": self._pack_map(self.vertex_map),
+            "initial_map": self._pack_map(self.initial_map)
         }
         return state
 
@@ -82,8 +109,8 @@ class VertexMemoryMap:
         instead of the vertex object.
         """
         logger.debug("Unpickling partial result vertex-memory map")
-        self.vertex_map = data["vertex_map"]
-        self.initial_map = data["initial_map"]
+        self.vertex_map = self._unpack_map(data["vertex_map"])
+        self.initial_map = self._unpack_map(data["initial_map"])
 
     def clear(self, addr):
         """
@@ -93,10 +120,7 @@ class VertexMemoryMap:
 
     def vertex_at(self, addr):
         """Return the vertex currently stored at a given address."""
-        try:
-            return self.vertex_map[addr]
-        except KeyError:
-            return None
+        return self.vertex_map.get(addr)
 
     def mem_load(self, addr, vertex=None):
         """
@@ -106,13 +130,10 @@ class VertexMemoryMap:
         in the memory map at the given address.
         """
         if vertex:
-            if addr not in self.initial_map:
-                self.initial_map[addr] = vertex                
+            self.initial_map.setdefault(addr, vertex)
             self.vertex_map[addr] = vertex
-        try:
-            return self.vertex_map[addr]
-        except KeyError:
-            return None
+            return vertex
+        return self.vertex_map.get(addr)
 
     def mem_store(self, addr, vertex):
         """
@@ -140,6 +161,12 @@ class RegisterSet:
     The high 32 registers are hardware registers accessed by c{read,write}hwr.
     """
 
+    pcc_index = cap_regfile_size
+    """
+    Index of pcc in the register set, pcc is stored after the register
+    file so that all registers are handled uniformly.
+    """
+
     def __init__(self, pgm):
         """
         Initialize the register set with partial vertices.
@@ -149,12 +176,9 @@ class RegisterSet:
         self.pgm = pgm
         """The provenance graph manager"""
 
-        vertices = self.pgm.graph.add_vertex(self.cap_regfile_size + 1)
         # the + 1 adds pcc to the list
-        self.reg_nodes = list(vertices)
-        """Graph node associated with each register."""
-
-        self.initial_reg_nodes = list(self.reg_nodes)
+        self.initial_reg_nodes = tuple(
+            self.pgm.graph.add_vertex(self.cap_regfile_size + 1))
         """
         The initial register set is created in worker processes
         to keep track of the initial dummy graph vertices that
@@ -162,13 +186,40 @@ class RegisterSet:
         subgraphs.
         """
 
+        self.reg_nodes = list(self.initial_reg_nodes)
+        """Graph node associated with each register."""
+
         self._pause_recovered = [True] * len(self.reg_nodes)
 
-        for n in self.reg_nodes:
+        vertex_index = [int(u) for u in self.initial_reg_nodes]
+
+        self._reg_refs = Counter(vertex_index)
+        """
+        Number of registers holding each vertex index, this is kept in
+        sync by :meth:`set_reg` and replaces scans of the register set.
+        """
+
+        self._partial_vertices = frozenset(vertex_index)
+        """
+        Index of the PARTIAL dummy vertices, these are only created
+        here so the set never changes while parsing.
+        """
+
+        self._attached_to_partial = self.pgm.graph.new_vertex_property(
+            "bool", val=False)
+        """
+        Mark ROOT vertices that have been attached to a PARTIAL vertex,
+        this avoids scanning the in-neighbours on every register write.
+        """
+
+        # the vertex origin is stored in the vertex data object so
+        # the dummy vertices can not be initialized in bulk
+        vertex_data = self.pgm.data
+        for n in self.initial_reg_nodes:
             data = ProvenanceVertexData()
             data.cap = CheriCap()
             data.origin = CheriNodeOrigin.PARTIAL
-            self.pgm.data[n] = data
+            vertex_data[n] = data
 
     def __getstate__(self):
         """
@@ -176,11 +227,16 @@ class RegisterSet:
         but their index is.
         """
         logger.debug("Pickling partial result register set %d", os.getpid())
+        # the vertex indices are packed in fixed-size arrays,
+        # empty registers are marked with -1
+        n_regs = len(self.reg_nodes)
         state = {
-            "reg_nodes": [self.pgm.graph.vertex_index[u] if u != None else None
-                          for u in self.reg_nodes],
-            "initial_reg_nodes": [self.pgm.graph.vertex_index[u]
-                                  for u in self.initial_reg_nodes],
+            "reg_nodes": np.fromiter(
+                (-1 if u is None else int(u) for u in self.reg_nodes),
+                dtype=np.int64, count=n_regs),
+            "initial_reg_nodes": np.fromiter(
+                map(int, self.initial_reg_nodes),
+                dtype=np.int64, count=len(self.initial_reg_nodes)),
             }
         return state
 
@@ -197,8 +253,9 @@ class RegisterSet:
         perform the operation to avoid confusion.
         """
         logger.debug("Unpickling partial result register set")
-        self.reg_nodes = data["reg_nodes"]
-        self.initial_reg_nodes = data["initial_reg_nodes"]
+        self.reg_nodes = [None if u < 0 else u
+                          for u in data["reg_nodes"].tolist()]
+        self.initial_reg_nodes = data["initial_reg_nodes"].tolist()
 
     def _attach_partial_vertex(self, regset_vertex, input_vertex):
         """
@@ -214,17 +271,21 @@ class RegisterSet:
         # the root is attached to the dummy.
         if input_vertex == None or regset_vertex == None:
             return
+        # check the register vertex first, once the dummy vertices are
+        # overwritten this skips the vertex data lookups altogether
+        if int(regset_vertex) not in self._partial_vertices:
+            return
 
         in_data = self.pgm.data[input_vertex]
-        if in_data.origin == CheriNodeOrigin.ROOT:
+        if in_data.origin == _ORIGIN_ROOT:
             # if the root is already attached to a partial, do nothing
-            for n in input_vertex.in_neighbours():
-                if self.pgm.data[n].origin == CheriNodeOrigin.PARTIAL:
-                    return
-            # else attach it to current partial if it exists
-            curr_data = self.pgm.data[regset_vertex]
-            if curr_data.origin == CheriNodeOrigin.PARTIAL:
-                self.pgm.graph.add_edge(regset_vertex, input_vertex)
+            # Note that ROOT vertices have no other inbound provenance
+            # edges, so the flag is equivalent to an in-neighbours scan.
+            if self._attached_to_partial[input_vertex]:
+                return
+            # else attach it to current partial
+            self.pgm.graph.add_edge(regset_vertex, input_vertex)
+            self._attached_to_partial[input_vertex] = True
 
     def _handle_out_of_scope(self, regset_vertex, time):
         """
@@ -232,7 +293,7 @@ class RegisterSet:
         register set completely and if it is not stored in memory
         anywhere then set the t_free time.
         """
-        if regset_vertex in self.reg_nodes or regset_vertex is None:
+        if regset_vertex is None or self.is_live(regset_vertex):
             return
         v_data = self.pgm.data[regset_vertex]
         if not v_data.has_active_memory():
@@ -247,13 +308,36 @@ class RegisterSet:
         :param time: time of the vertex store
         """
         old_vertex = self.reg_nodes[index]
-        logger.debug("{%d} reg[%d] %s <- %s", time, index,
-                     self.pgm.data[old_vertex] if old_vertex else None,
-                     self.pgm.data[value] if value else None)
+        if logger.isEnabledFor(logging.DEBUG):
+            # avoid the vertex data lookups when debug is disabled
+            logger.debug("{%d} reg[%d] %s <- %s", time, index,
+                         self.pgm.data[old_vertex] if old_vertex else None,
+                         self.pgm.data[value] if value else None)
+        # compare vertex indices, this avoids the graph-tool vertex
+        # comparison and each index is converted only once
+        new_index = None if value is None else int(value)
+        old_index = None if old_vertex is None else int(old_vertex)
+        if new_index == old_index:
+            # the register already holds the vertex, nothing changes
+            return
         self._attach_partial_vertex(old_vertex, value)
         self.reg_nodes[index] = value
-        if value != old_vertex:
-            self._handle_out_of_scope(old_vertex, time)
+        reg_refs = self._reg_refs
+        if new_index is not None:
+            reg_refs[new_index] += 1
+        if old_index is not None:
+            reg_refs[old_index] -= 1
+            if reg_refs[old_index] == 0:
+                del reg_refs[old_index]
+        self._handle_out_of_scope(old_vertex, time)
+
+    def is_live(self, vertex):
+        """
+        Check whether a vertex is held by any register.
+
+        :param vertex: the vertex to look for
+        """
+        return int(vertex) in self._reg_refs
 
     def get_reg(self, index):
         """
@@ -264,13 +348,16 @@ class RegisterSet:
         return self.reg_nodes[index]
 
     def get_pcc(self):
-        return self.get_reg(64)
+        return self.get_reg(self.pcc_index)
 
     def set_pcc(self, value, time):
-        self.set_reg(64, value, time)
+        self.set_reg(self.pcc_index, value, time)
 
     def has_pcc(self, expected, time, allow_root=False):
-        return self.has_reg(64, expected, time, allow_root)
+        return self.has_reg(self.pcc_index, expected, time, allow_root)
+
+    def lookup_pcc(self, expected, time, allow_root=False):
+        return self.lookup_reg(self.pcc_index, expected, time, allow_root)
 
     def set_epcc(self, value, time):
         self.set_reg(63, value, time)
@@ -308,17 +395,26 @@ class RegisterSet:
         :param allow_root: a root can be created if the register
         does not have a valid node.
         """
-        if self.reg_nodes[idx] is None:
-            return False
-        if allow_root:
-            data = self.pgm.data[self.reg_nodes[idx]]
-            if data.origin == CheriNodeOrigin.PARTIAL:
-                return False
+        return self.lookup_reg(idx, expected, time, allow_root) is not None
+
+    def lookup_reg(self, idx, expected, time, allow_root=False):
+        """
+        Get the vertex associated with a register if the register set
+        contains a valid entry for it, see :meth:`has_reg`.
+        This avoids a separate lookup of the register after the check.
+
+        :return: the register vertex or None
+        """
+        vertex = self.reg_nodes[idx]
+        if vertex is None:
+            return None
+        if allow_root and self.pgm.data[vertex].origin == _ORIGIN_PARTIAL:
+            return None
         if not self._pause_recovered[idx]:
             logger.debug("Resume register %d %s", idx, CheriCap(expected))
             self._recover_paused_reg(idx, expected, time)
-            return self.reg_nodes[idx] is not None
-        return True
+            return self.reg_nodes[idx]
+        return vertex
 
     def _is_cap_compatible(self, data, cap):
         """
@@ -383,14 +479,56 @@ class RegisterSet:
 
     def __str__(self):
         dump = "Register set:\n"
-        for i, v in enumerate(self.reg_nodes):
-            origin = self.pgm.data[v].origin if v else ""
+        for i, v in enumerate(self.reg_nodes[:self.cap_regfile_size]):
+            origin = self.pgm.data[v].origin if v is not None else ""
             dump += "c%d -> %s %s\n" % (i, v, origin)
-        origin = self.pgm.data[self.pcc].origin if self.pcc else ""
-        dump += "pcc -> %s %s\n" % (self.pcc, origin)
+        pcc = self.get_pcc()
+        origin = self.pgm.data[pcc].origin if pcc is not None else ""
+        dump += "pcc -> %s %s\n" % (pcc, origin)
         return dump
 
     
+def _rebuild_vertex_map(vertex_map, initial_map):
+    """Rebuild a :class:`VertexMemoryMap` sent by a worker process."""
+    vmap = VertexMemoryMap.__new__(VertexMemoryMap)
+    vmap.vertex_map = VertexMemoryMap._unpack_map(vertex_map)
+    vmap.initial_map = VertexMemoryMap._unpack_map(initial_map)
+    return vmap
+
+
+def _reduce_vertex_map(vmap):
+    """
+    Reduce a :class:`VertexMemoryMap` to the packed address and
+    vertex arrays when it is sent between processes.
+    """
+    return (_rebuild_vertex_map, (vmap._pack_map(vmap.vertex_map),
+                                  vmap._pack_map(vmap.initial_map)))
+
+
+def _rebuild_register_set(reg_nodes, initial_reg_nodes):
+    """Rebuild a :class:`RegisterSet` sent by a worker process."""
+    regset = RegisterSet.__new__(RegisterSet)
+    regset.reg_nodes = [None if u < 0 else u for u in reg_nodes.tolist()]
+    regset.initial_reg_nodes = initial_reg_nodes.tolist()
+    return regset
+
+
+def _reduce_register_set(regset):
+    """
+    Reduce a :class:`RegisterSet` to the packed vertex index arrays
+    when it is sent between processes.
+    """
+    state = regset.__getstate__()
+    return (_rebuild_register_set, (state["reg_nodes"],
+                                    state["initial_reg_nodes"]))
+
+
+# worker results are sent through the multiprocessing pickler, register
+# reducers that skip the generic object state protocol
+ForkingPickler.register(VertexMemoryMap, _reduce_vertex_map)
+ForkingPickler.register(RegisterSet, _reduce_register_set)
+
+
 class CheriplotModelParser(MultiprocessCallbackParser):
     """
     Cheri-mips top-level cheriplot trace parser
@@ -451,6 +589,9 @@ class CheriplotModelParser(MultiprocessCallbackParser):
         Note: this method is run in the main process,
         assuming that the results are in-order w.r.t.
         the trace entries indexes that were used.
+
+        :param results: iterable of worker results, the results may be
+        produced while the merge is in progress
         """
         # if self.mp.threads == 1:
         #     # need to merge partial vertices from the beginning of
@@ -461,5 +602,7 @@ class CheriplotModelParser(MultiprocessCallbackParser):
         merge_ctx = self.subgraph_merge_context_class(self.final_pgm)
         for idx, result in enumerate(results):
             with ProgressTimer("Merge partial worker result [%d/%d]" % (
-                    idx + 1, len(results)), logger):
+                    idx + 1, self.mp.threads), logger):
                 merge_ctx.step(result)
+            # release the worker result before the next one is received
+            del result
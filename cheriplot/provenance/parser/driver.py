@@ -29,8 +29,11 @@ Driver for the graph parsing. This is the task that generates a cheriplot
 graph from a trace input.
 """
 
+import hashlib
 import logging
+import os
 
+from cheriplot import __version__
 from cheriplot.core import (
     BaseToolTaskDriver, BaseTraceTaskDriver, Option, Argument, NestedConfig,
     ProgressTimer, file_path_validator)
@@ -51,6 +54,14 @@ class GraphParserDriver(BaseTraceTaskDriver):
     * :class:`BaseTraceTaskDriver` parameters
     * threads: the number of threads to use (default 1)
     * outfile: the output trace file (default <trace_file_name>_graph.gt
+    * force: parse the trace even if the output graph is up to date
+
+    The key of the trace and parse options used to generate the output
+    graph is stored in a <outfile>.key file next to the graph, together
+    with the mtime and size of the graph file when it was written.
+    The parsing is skipped if the trace and options are unchanged and the
+    graph file has not been modified since it was generated, other tools
+    may overwrite the graph in place (e.g. symbol resolution or filters).
     """
     description = """
     Trace parse tool.
@@ -72,6 +83,9 @@ class GraphParserDriver(BaseTraceTaskDriver):
         default="256",
         choices=("128", "256"),
         help="Cheri capability size")
+    force = Option(
+        action="store_true",
+        help="Parse the trace even if the output graph is up to date")
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -87,17 +101,86 @@ class GraphParserDriver(BaseTraceTaskDriver):
         self.pgm = ProvenanceGraphManager(outfile)
         """Graph manager."""
 
-        self._parser = CheriMipsModelParser(
-            self.pgm, capability_size=cap_size, trace_path=self.config.trace,
-            threads=self.config.threads)
+        self._keyfile = "{}.key".format(outfile)
+        """File holding the key of the parse that generated the graph."""
+
+        self._trace_key = self._get_trace_key(self.config.trace, cap_size)
+        """Key of the input trace and parse options."""
+
+        self._parser = None
         """Graph parser strategy, depends on the architecture."""
 
+        if self.config.force or not self._is_up_to_date():
+            self._parser = CheriMipsModelParser(
+                self.pgm, capability_size=cap_size,
+                trace_path=self.config.trace, threads=self.config.threads)
+
+    def _get_trace_key(self, trace_path, cap_size):
+        """
+        Build a key that identifies the parse output.
+        The content of the trace file is identified without reading it,
+        from the path, mtime and size. The key also includes the options
+        that change the parse and the cheriplot version, so a graph
+        generated by a different parser is never reused.
+
+        :param trace_path: path to the trace file
+        :param cap_size: capability size in bytes
+        :return: hex digest string or None if the trace does not exist,
+        the parser reports the missing trace.
+        """
+        if not os.path.exists(trace_path):
+            return None
+        stat = os.stat(trace_path)
+        key = "{}:{}:{}:cap{}:threads{}:v{}".format(
+            os.path.abspath(trace_path), stat.st_mtime, stat.st_size,
+            cap_size, self.config.threads, __version__)
+        return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+    def _get_graph_key(self):
+        """
+        Identify the current content of the output graph file from
+        its mtime and size.
+        """
+        stat = os.stat(self.pgm.outfile)
+        return "{}:{}".format(stat.st_mtime_ns, stat.st_size)
+
+    def _is_up_to_date(self):
+        """
+        Check whether the output graph has been generated from the
+        same trace and options we are parsing with and has not been
+        modified since.
+        """
+        if (self._trace_key is None or
+            not os.path.exists(self.pgm.outfile) or
+            not os.path.exists(self._keyfile)):
+            return False
+        with open(self._keyfile, "r") as keyfile:
+            key = keyfile.read().split()
+        return key == [self._trace_key, self._get_graph_key()]
+
+    def _save_graph(self):
+        """
+        Save the output graph and record the key of the parse and
+        of the graph file written.
+        """
+        self.pgm.save(name=self.config.display_name)
+        with open(self._keyfile, "w") as keyfile:
+            keyfile.write("{}\n{}\n".format(
+                self._trace_key, self._get_graph_key()))
+
     def run(self):
+        if self._parser is None:
+            logger.info("Graph %s is up to date with trace %s, skip parsing",
+                        self.pgm.outfile, self.config.trace)
+            if self.config.display_name is not None:
+                self.pgm = ProvenanceGraphManager.load(self.pgm.outfile)
+                self._save_graph()
+            return
         self._parser.parse()
         # get the parsed provenance graph model
-        self.pgm.save(name=self.config.display_name)
+        self._save_graph()
         # force free the parser to reclaim memory
-        del self._parser
+        self._parser = None
 
 
 class SymbolResolutionDriver(BaseToolTaskDriver):
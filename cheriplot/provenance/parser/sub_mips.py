@@ -29,12 +29,16 @@ CHERI-MIPS specific subparsers that build the cheriplot graph
 """
 
 import logging
+import numpy as np
+from array import array
 from functools import partial
 from collections import deque
 from contextlib import suppress
 from itertools import chain
 
-from cheriplot.core.parser import CheriMipsCallbacksManager
+from graph_tool.topology import is_DAG, topological_sort
+
+from cheriplot.core.parser import CheriMipsCallbacksManager, IClass
 from cheriplot.provenance.model import (
     CheriNodeOrigin, CheriCapPerm, ProvenanceVertexData,
     CheriCap, CallVertexData, EdgeOperation, EventType)
@@ -46,10 +50,85 @@ from .error import *
 
 logger = logging.getLogger(__name__)
 
+# enum values compared in the parser and merge hot paths
+_ORIGIN_ROOT = int(CheriNodeOrigin.ROOT)
+_ORIGIN_PARTIAL = int(CheriNodeOrigin.PARTIAL)
+_PERM_EXEC = int(CheriCapPerm.EXEC)
+_EVENT_DEREF_LOAD = int(EventType.DEREF_LOAD)
+_EVENT_DEREF_STORE = int(EventType.DEREF_STORE)
+
+def _cap_load_ptr_operand(opcode):
+    """
+    Get the operand holding the pointer capability of a capability load.
+
+    clX[u] have pointer argument in op3
+    clXr and clXi have pointer argument in op2
+    cllX have pointer argument in op1
+    """
+    if opcode.startswith("cll"):
+        return "op1"
+    if opcode[-1] == "r" or opcode[-1] == "i":
+        return "op2"
+    return "op3"
+
+def _cap_store_ptr_operand(opcode):
+    """
+    Get the operand holding the pointer capability of a capability store.
+
+    csX have pointer argument in op3
+    csXr and csXi have pointer argument in op2
+    cscX conditionals use op2
+    """
+    if opcode != "csc" and opcode.startswith("csc"):
+        # atomic
+        return "op2"
+    if opcode[-1] == "r" or opcode[-1] == "i":
+        return "op2"
+    return "op3"
+
+# pointer operand of the capability loads and stores, the opcodes are
+# resolved once here instead of matching the mnemonic for each instruction
+_CAP_LOAD_PTR_OPERAND = {
+    opcode: _cap_load_ptr_operand(opcode) for opcode in
+    CheriMipsCallbacksManager.iclass_map[IClass.I_CAP_LOAD]}
+_CAP_STORE_PTR_OPERAND = {
+    opcode: _cap_store_ptr_operand(opcode) for opcode in
+    CheriMipsCallbacksManager.iclass_map[IClass.I_CAP_STORE]}
+
+# capability loads and stores that move a whole capability
+_CAP_SIZED_MEMOP = frozenset(
+    opcode for opcode in chain(_CAP_LOAD_PTR_OPERAND, _CAP_STORE_PTR_OPERAND)
+    if opcode.startswith("clc") or opcode == "csc" or opcode == "cscbi")
+
+def _cap_register_equal(a, b):
+    """
+    Compare two pycheritrace capability registers as the equivalent
+    :class:`CheriCap` objects would compare, without building them.
+    Invalid registers have a None value, as for :class:`CheriCap`
+    they are equal only to each other.
+    """
+    if a is None or b is None:
+        return a is None and b is None
+    return (a.base == b.base and
+            a.length == b.length and
+            a.offset == b.offset and
+            a.permissions == b.permissions and
+            a.type & CheriCap.MAX_OTYPE == b.type & CheriCap.MAX_OTYPE and
+            a.valid == b.valid and
+            a.unsealed == b.unsealed)
+
 class MergePartialSubgraphContext:
     """
     Hold the context information for the merge subgraph transform
     steps.
+
+    The steps are a left fold over the worker results in trace order.
+    Each step resolves the PARTIAL vertices of a subgraph against the
+    final register set, memory map and subparsers state of everything
+    merged before it, so two subgraphs can not be merged with each other
+    without the state of the prefix that precedes them. The merge is
+    overlapped with parsing instead, see
+    :meth:`MultiprocessCallbackParser.parse`.
     """
 
     def __init__(self, main_pgm):
@@ -125,6 +204,11 @@ class MergePartialSubgraphContext:
         transform(result["pgm"].graph)
         self.prev_cycles_end = result["cycles_end"]
         self.step_idx += 1
+        # drop the subgraph and the per-step copy and omit maps
+        # now, so that their storage can be reused for the next step
+        # instead of growing the heap while the next result is loaded
+        self.pgm_subgraph = None
+        self.curr_vmap = None
 
 
 class MergePartialSubgraph(BFSGraphVisit):
@@ -159,10 +243,47 @@ class MergePartialSubgraph(BFSGraphVisit):
             to the merged graph.
             """
 
+            self._omit_vertex_array = self.omit_vertex_map.a
+            """
+            Array view of the omit map, used for the per-vertex check in
+            :meth:`examine_vertex`. No vertices are added to the subgraph
+            during the merge so the view stays valid.
+            """
+
             self.copy_edge_map = self.subgraph.new_edge_property(
                 "bool", val=False)
             """Keep track of which edges have been merged."""
 
+            self._initial_mem_addr = {}
+            """
+            Inverse of the initial vertex memory map, maps a subgraph
+            vertex index to the first address where it was found.
+            """
+            for addr, u in self.vertex_map.initial_map.items():
+                self._initial_mem_addr.setdefault(int(u), addr)
+
+            self._initial_reg_index = {}
+            """
+            Inverse of the initial register set, maps a subgraph
+            vertex index to the first register that holds it.
+            """
+            for index, u in enumerate(self.curr_regset.initial_reg_nodes):
+                self._initial_reg_index.setdefault(int(u), index)
+
+            self._pending_edges = []
+            """
+            Merged graph edges that are added in bulk when the merge
+            step is finalized, each item is a tuple
+            (source, target, time, addr, operation, regs).
+            """
+
+            self._vertex_handlers = self._get_vertex_handlers()
+            """
+            Map the index of the subgraph vertices that require a specific
+            merge operation to the method that merges them,
+            see :meth:`examine_vertex`.
+            """
+
     @property
     def graph(self):
         """Merged graph that we are building."""
@@ -213,10 +334,80 @@ class MergePartialSubgraph(BFSGraphVisit):
         """
         return self.context.prev_vmap
 
+    def _get_vertex_handlers(self):
+        """
+        Build the merge dispatch table for the subgraph vertices that
+        are not merged as normal vertices. These are the initial register
+        set and memory vertices and the vertices marked by the subparsers
+        results. Any other vertex is merged by
+        :meth:`_merge_subgraph_vertex`.
+
+        :return: dict mapping vertex indices to merge methods
+        """
+        handlers = {}
+        if self.context.step_idx == 0:
+            # merge initial and normal vertices but ignore the vertex
+            # memory map
+            for u in self._initial_reg_index:
+                handlers[u] = self._merge_initial_vertex
+            return handlers
+
+        # lower priority handlers are overridden by the following ones
+        for u in self._initial_mem_addr:
+            handlers[u] = self._merge_initial_mem_vertex
+        for u in self._initial_reg_index:
+            handlers[u] = self._merge_initial_vertex
+        cg_root = self.context.curr_callgraph["root"]
+        if cg_root is not None:
+            handlers[int(cg_root)] = self._merge_callgraph
+        # handle syscall merges before the vertex is merged
+        subparser_merges = {}
+        marked = ((self.context.curr_pcc_fixup["epcc"], self._merge_pcc_fixup),
+                  (self.context.curr_syscall["eret_cap"], self._merge_syscall))
+        for u, merge_fn in marked:
+            if u is not None:
+                subparser_merges.setdefault(int(u), []).append(merge_fn)
+        for u, merge_fns in subparser_merges.items():
+            handlers[u] = partial(
+                self._merge_subparser_vertex, merge_fns,
+                handlers.get(u, self._merge_subgraph_vertex))
+        return handlers
+
+    def _merge_subparser_vertex(self, subparser_merges, merge_fn, u):
+        """
+        Merge a vertex marked by a subparser result.
+
+        :param subparser_merges: list of subparser merge methods to
+        call before merging the vertex
+        :param merge_fn: method that merges the vertex
+        :param u: the vertex in the partial subgraph
+        """
+        for subparser_merge in subparser_merges:
+            subparser_merge(u)
+        merge_fn(u)
+
+    def _do_visit(self, graph_view):
+        """
+        Visit the subgraph vertices so that every vertex is merged
+        after its parents.
+        The merge only requires that the PARTIAL and ROOT vertices are
+        examined before their children, so for acyclic subgraphs the
+        topological order is computed upfront in C++ and only
+        :meth:`examine_vertex` is called for each vertex, instead of
+        all the python BFS visitor callbacks for vertices and edges.
+        """
+        if not is_DAG(graph_view):
+            return super()._do_visit(graph_view)
+        vertex = graph_view.vertex
+        for u in topological_sort(graph_view).tolist():
+            self._examine_vertex_index(u, vertex)
+        return self.finalize(graph_view)
+
     def finalize(self, graph_view):
         """
         Finalize the context for this merge step
         """
+        self._flush_edges()
         self.context.prev_regset = self.get_final_regset()
         self.context.prev_vmap = self.get_final_vmap()
         self.context.prev_pcc_fixup = self.get_final_pcc_fixup()
@@ -241,9 +432,11 @@ class MergePartialSubgraph(BFSGraphVisit):
 
     def get_final_syscall(self):
         """
-        Return the syscall subparser state to be used in the next merge step
+        Return the syscall subparser state to be used in the next merge step.
+        The worker result is not used after this step so it is
+        updated in place.
         """
-        sys_result = dict(self.context.curr_syscall)
+        sys_result = self.context.curr_syscall
         if sys_result["eret_cap"] != None and self.context.step_idx > 0:
             # translate the saved vertex to an index in the merged graph
             v = self.copy_vertex_map[sys_result["eret_cap"]]
@@ -259,9 +452,11 @@ class MergePartialSubgraph(BFSGraphVisit):
 
     def get_final_pcc_fixup(self):
         """
-        Return the pcc fixup state to be used by the next merge step
+        Return the pcc fixup state to be used by the next merge step.
+        The worker result is not used after this step so it is
+        updated in place.
         """
-        pcc_fixup = dict(self.context.curr_pcc_fixup)
+        pcc_fixup = self.context.curr_pcc_fixup
         if pcc_fixup["saved_pcc"] != None:
             # translate the saved vertex to an index in the merged graph
             v_pcc = self.copy_vertex_map[pcc_fixup["saved_pcc"]]
@@ -283,12 +478,14 @@ class MergePartialSubgraph(BFSGraphVisit):
         This is used as input to the next merge operation as previous_regset.
         """
         regset = self.curr_regset
-        for idx in range(len(self.curr_regset.reg_nodes)):
-            v = self.curr_regset.reg_nodes[idx]
-            if v == None or self.copy_vertex_map[v] < 0:
-                regset.reg_nodes[idx] = None
-            else:
-                regset.reg_nodes[idx] = self.copy_vertex_map[v]
+        copy_map = self.copy_vertex_map.a
+        # translate all the registers with a single gather on the
+        # copy map, -1 marks empty registers and vertices not copied
+        src = np.fromiter(
+            (-1 if v is None else int(v) for v in regset.reg_nodes),
+            dtype=np.int64, count=len(regset.reg_nodes))
+        dst = np.where(src < 0, -1, copy_map[np.maximum(src, 0)])
+        regset.reg_nodes[:] = [None if v < 0 else v for v in dst.tolist()]
         logger.debug("Final regset:\n%s", regset.reg_nodes)
         return regset
 
@@ -300,10 +497,16 @@ class MergePartialSubgraph(BFSGraphVisit):
         This is used as input to the next merge operation as previous_vmap.
         """
         vmap = VertexMemoryMap(None)
-        for key,u in self.vertex_map.vertex_map.items():
-            if self.copy_vertex_map[u] >= 0:
-                # valid vertex handle
-                vmap.vertex_map[key] = self.copy_vertex_map[u]
+        curr_map = self.vertex_map.vertex_map
+        n_items = len(curr_map)
+        addrs = np.fromiter(curr_map.keys(), dtype=np.uint64, count=n_items)
+        src = np.fromiter(map(int, curr_map.values()), dtype=np.int64,
+                          count=n_items)
+        dst = self.copy_vertex_map.a[src]
+        # keep only valid vertex handles
+        valid = dst >= 0
+        vmap.vertex_map = dict(zip(addrs[valid].tolist(),
+                                   dst[valid].tolist()))
         return vmap
 
     def _merge_partial_vertex_data(self, u, v):
@@ -321,17 +524,31 @@ class MergePartialSubgraph(BFSGraphVisit):
         for key, val in u_data.events.items():
             v_data.events[key].extend(val)
 
-    def _merge_edge_data(self, e, f):
+    def _merge_edge_data(self, e, source, target):
         """
-        Copy edge data from a subgraph edge to a merged graph edge.
+        Queue a merged graph edge with the data of a subgraph edge.
+        The edges are created by :meth:`_flush_edges`.
 
         :param e: the source edge in the partial subgraph
-        :param f: the destiantion edge in the merged subgraph
+        :param source: source vertex index in the merged graph
+        :param target: target vertex index in the merged graph
         """
-        self.graph.ep.time[f] = self.subgraph.ep.time[e]
-        self.graph.ep.addr[f] = self.subgraph.ep.addr[e]
-        self.graph.ep.operation[f] = self.subgraph.ep.operation[e]
-        self.graph.ep.regs[f] = self.subgraph.ep.regs[e]
+        subgraph_ep = self.subgraph.ep
+        self._pending_edges.append(
+            (source, target, subgraph_ep.time[e], subgraph_ep.addr[e],
+             subgraph_ep.operation[e], list(subgraph_ep.regs[e])))
+
+    def _flush_edges(self):
+        """
+        Add the queued edges and their data to the merged graph
+        with a single call.
+        """
+        graph_ep = self.graph.ep
+        self.graph.add_edge_list(
+            self._pending_edges,
+            eprops=[graph_ep.time, graph_ep.addr, graph_ep.operation,
+                    graph_ep.regs])
+        self._pending_edges = []
 
     def _merge_layer(self, u, v):
         """
@@ -340,8 +557,10 @@ class MergePartialSubgraph(BFSGraphVisit):
         :param u: source vertex in the partial subgraph
         :param v: destination vertex in the merged graph
         """
-        self.graph.vp.layer_prov[v] = self.subgraph.vp.layer_prov[u]
-        self.graph.vp.layer_call[v] = self.subgraph.vp.layer_call[u]
+        graph_vp = self.graph.vp
+        subgraph_vp = self.subgraph.vp
+        graph_vp.layer_prov[v] = subgraph_vp.layer_prov[u]
+        graph_vp.layer_call[v] = subgraph_vp.layer_call[u]
 
     def _update_time(self, u):
         """
@@ -350,21 +569,20 @@ class MergePartialSubgraph(BFSGraphVisit):
 
         :param u: the subgraph vertex to update
         """
-        u_data = self.subgraph.vp.data[u]
+        subgraph_vp = self.subgraph.vp
+        u_data = subgraph_vp.data[u]
         delta = abs(self.context.prev_cycles_end -
                     self.context.curr_cycles_start) - 1
-        if self.subgraph.vp.layer_prov[u]:
-            u_data.events["time"][:] = (t + delta for t in u_data.events["time"])
-            if u_data.cap:
-                u_data.cap.t_alloc += delta
-                if u_data.cap.t_free >= 0:
-                    u_data.cap.t_free += delta
-        elif self.subgraph.vp.layer_call[u]:
-            try:
+        if subgraph_vp.layer_prov[u]:
+            u_data.shift_event_time(delta)
+            cap = u_data.cap
+            if cap:
+                cap.t_alloc += delta
+                if cap.t_free >= 0:
+                    cap.t_free += delta
+        elif subgraph_vp.layer_call[u]:
+            if u_data.t_return is not None:
                 u_data.t_return += delta
-            except TypeError:
-                # t_return is None
-                pass
 
     def _check_cap_compatible(self, u_data, v_data):
         """
@@ -374,10 +592,10 @@ class MergePartialSubgraph(BFSGraphVisit):
         actually represent the same thing.
         Used in merge decisions for ROOT vertices.
         """
-        return not (u_data.cap.base != v_data.cap.base or
-                    u_data.cap.length != v_data.cap.length or
-                    u_data.cap.permissions != v_data.cap.permissions or
-                    u_data.cap.objtype != v_data.cap.objtype)
+        u_cap = u_data.cap
+        v_cap = v_data.cap
+        return ((u_cap.base, u_cap.length, u_cap.permissions, u_cap.objtype) ==
+                (v_cap.base, v_cap.length, v_cap.permissions, v_cap.objtype))
 
     def _check_layer(self, u, v):
         """
@@ -386,8 +604,10 @@ class MergePartialSubgraph(BFSGraphVisit):
         :param u: vertex in the partial subgraph
         :param v: vertex in the merged graph
         """
-        prov = self.subgraph.vp.layer_prov[u] == self.graph.vp.layer_prov[v]
-        call = self.subgraph.vp.layer_call[u] == self.graph.vp.layer_call[v]
+        graph_vp = self.graph.vp
+        subgraph_vp = self.subgraph.vp
+        prov = subgraph_vp.layer_prov[u] == graph_vp.layer_prov[v]
+        call = subgraph_vp.layer_call[u] == graph_vp.layer_call[v]
         return prov and call
 
     def _merge_initial_vertex(self, u):
@@ -406,7 +626,7 @@ class MergePartialSubgraph(BFSGraphVisit):
             logger.debug("Merge trace beginning initial vertex subgraph:%d", u)
             self._merge_trace_beginning(u)
         else:
-            index = self.curr_regset.initial_reg_nodes.index(u)
+            index = self._initial_reg_index[int(u)]
             v = self.previous_regset.reg_nodes[index]
             logger.debug("Merge initial vertex (register %s)", index)
 
@@ -429,15 +649,7 @@ class MergePartialSubgraph(BFSGraphVisit):
         Then the previous vertex and the current ROOT vertex must be compatible,
         otherwise it is an error. If they are compatible suppress the ROOT.
         """
-        u_addr = None
-        # XXX suboptimal way of searching, hopefully it's not too bad
-        # depends on the working set in memory though. The probelm here
-        # is that we want fast lookup on the address key but also on the
-        # mapped value
-        for key,val in self.vertex_map.initial_map.items():
-            if val == u:
-                u_addr = key
-                break
+        u_addr = self._initial_mem_addr.get(int(u))
         try:
             v = self.previous_vmap.vertex_map[u_addr]
         except KeyError:
@@ -480,7 +692,9 @@ class MergePartialSubgraph(BFSGraphVisit):
         Since it is ambiguous which root should be the parent of any non-root
         vertices, promote them to roots.
         """
-        u_data = self.subgraph.vp.data[u]
+        sub_data = self.subgraph.vp.data
+        sub_layer_prov = self.subgraph.vp.layer_prov
+        u_data = sub_data[u]
         merged_root = None
         roots = []
         other = []
@@ -492,11 +706,11 @@ class MergePartialSubgraph(BFSGraphVisit):
         # only consider children in the provenance layer
         # edges between the call-layer and partial vertices are discarded
         for u_out in u.out_neighbours():
-            if not self.subgraph.vp.layer_prov[u_out]:
+            if not sub_layer_prov[u_out]:
                 continue
             # child in the provenance layer
-            u_out_data = self.subgraph.vp.data[u_out]
-            if u_out_data.origin == CheriNodeOrigin.ROOT:
+            u_out_data = sub_data[u_out]
+            if u_out_data.origin == _ORIGIN_ROOT:
                 roots.append(u_out)
             else:
                 other.append(u_out)
@@ -510,7 +724,7 @@ class MergePartialSubgraph(BFSGraphVisit):
             perms = 0
             t_alloc = 2**64
             for u_out in other:
-                u_out_data = self.subgraph.vp.data[u_out]
+                u_out_data = sub_data[u_out]
                 base = min(base, u_out_data.cap.base)
                 bound = max(bound, u_out_data.cap.base + u_out_data.cap.length)
                 perms = perms | u_out_data.cap.permissions
@@ -535,7 +749,7 @@ class MergePartialSubgraph(BFSGraphVisit):
             # promote everything to root because there is no way to be sure
             # about provenance in this case.
             for u_out in chain(roots, other):
-                u_out_data = self.subgraph.vp.data[u_out]
+                u_out_data = sub_data[u_out]
                 u_out_data.origin = CheriNodeOrigin.ROOT
 
     def _merge_initial_vertex_to_none(self, u):
@@ -547,10 +761,9 @@ class MergePartialSubgraph(BFSGraphVisit):
         because this counts as an empty register now.
         it can have been stored, it is just storing None.
         """
-        u_data = self.subgraph.vp.data[u]
-        # get the length in constant memory instad of O(n) memory
-        n_deref = sum(1 for etype in u_data.events["type"]
-                      if etype & EventType.deref_mask())
+        sub_data = self.subgraph.vp.data
+        u_data = sub_data[u]
+        n_deref = u_data.count_events(EventType.deref_mask())
         if n_deref:
             raise SubgraphMergeError("PARTIAL vertex was dereferenced "
                                      "but is merged to None")
@@ -559,8 +772,8 @@ class MergePartialSubgraph(BFSGraphVisit):
         # matching bounds? also if multiple roots are attached
         # this may be a problem?
         for u_out in u.out_neighbours():
-            u_out_data = self.subgraph.vp.data[u_out]
-            if u_out_data.origin != CheriNodeOrigin.ROOT:
+            u_out_data = sub_data[u_out]
+            if u_out_data.origin != _ORIGIN_ROOT:
                 raise MissingParentError(
                     "Missing parent for %s" % u_out_data)
 
@@ -577,20 +790,21 @@ class MergePartialSubgraph(BFSGraphVisit):
         self.copy_vertex_map[u] = v
         # XXX check that prev is also in the same layer
         self._merge_partial_vertex_data(u, v)
+        sub_data = self.subgraph.vp.data
+        v_data = self.graph.vp.data[v]
         for u_out in u.out_neighbours():
             logger.debug("initial vertex out-neighbour subgraph:%s", u_out)
-            u_out_data = self.subgraph.vp.data[u_out]
+            u_out_data = sub_data[u_out]
             if u_out.in_degree() != 1:
                 raise SubgraphMergeError(
                     "vertex %s attached to multiple partial nodes" % u_out_data)
             # check that v_data agrees with all roots
             # that will be suppressed
-            if u_out_data.origin == CheriNodeOrigin.ROOT:
+            if u_out_data.origin == _ORIGIN_ROOT:
                 # suppress u_out but attach its children to
                 # the dummy so the connectivity is preserved
                 # so all dereferences and stores of u_out are merged in the
                 # parent
-                v_data = self.graph.vp.data[v]
                 self._merge_partial_vertex_data(u_out, v)
                 if not self._check_cap_compatible(u_out_data, v_data):
                     logger.debug("do not suppress ROOT %s, previous "
@@ -606,39 +820,45 @@ class MergePartialSubgraph(BFSGraphVisit):
         Merge a generic vertex from the subgraph to the main merged graph.
         Case (3) of examine_vertex
         """
-        v = self.graph.add_vertex()
+        graph = self.graph
+        copy_vertex_map = self.copy_vertex_map
+        copy_edge_map = self.copy_edge_map
+        v = graph.add_vertex()
         self._update_time(u)
         udata = self.subgraph.vp.data[u]
-        self.graph.vp.data[v] = udata
+        graph.vp.data[v] = udata
         self._merge_layer(u, v)
-        self.copy_vertex_map[u] = v
+        copy_vertex_map[u] = v
+        is_root = (self.subgraph.vp.layer_prov[u] and
+                   udata.origin == _ORIGIN_ROOT)
+        debug = logger.isEnabledFor(logging.DEBUG)
 
         # merge all edges to neighbours if they have not been added yet
         # we look for both in and out neighbours because we can not rely
         # on traversal ordering.
         for e in u.all_edges():
-            logger.debug("scanning edge %d -> %d", e.source(), e.target())
-            if (self.copy_edge_map[e] or self.copy_vertex_map[e.target()] < 0 or
-                self.copy_vertex_map[e.source()] < 0):
+            if debug:
+                logger.debug("scanning edge %d -> %d", e.source(), e.target())
+            if (copy_edge_map[e] or copy_vertex_map[e.target()] < 0 or
+                copy_vertex_map[e.source()] < 0):
                 # edge already copied or one of the edge ends
                 # have not been copied yet, skip
                 continue
             # go on and copy the edge
-            self.copy_edge_map[e] = True
+            copy_edge_map[e] = True
             if u == e.source():
-                target = self.copy_vertex_map[e.target()]
-                merged_edge = self.graph.add_edge(v, target)
+                source = int(v)
+                target = copy_vertex_map[e.target()]
             else:
-                if (self.subgraph.vp.layer_prov[u] and
-                    udata.origin == CheriNodeOrigin.ROOT):
+                if is_root:
                     # do not copy edges to a root vertex
                     continue
-                source = self.copy_vertex_map[e.source()]
-                merged_edge = self.graph.add_edge(source, v)
-            self._merge_edge_data(e, merged_edge)
-            logger.debug("merged edge %d -> %d as %d -> %d",
-                         e.source(), e.target(),
-                         merged_edge.source(), merged_edge.target())
+                source = copy_vertex_map[e.source()]
+                target = int(v)
+            self._merge_edge_data(e, source, target)
+            if debug:
+                logger.debug("merged edge %d -> %d as %d -> %d",
+                             e.source(), e.target(), source, target)
 
     def _merge_pcc_fixup(self, u):
         """
@@ -663,12 +883,12 @@ class MergePartialSubgraph(BFSGraphVisit):
             # restore epcc to its previous value.
             # u == epcc node
             u_data = self.subgraph.vp.data[u]
-            if u_data.origin == CheriNodeOrigin.PARTIAL:
+            if u_data.origin == _ORIGIN_PARTIAL:
                 # u is a dummy vertex that will be merged
                 # need to replace the corresponding parent with the
                 # saved pcc and the merge will be handled by the
                 # initial vertex merge.
-                index = self.curr_regset.initial_reg_nodes.index(u)
+                index = self._initial_reg_index[int(u)]
                 self.previous_regset.reg_nodes[index] = prev_result["saved_pcc"]
             else:
                 # normal vertex, there is no such thing as an initial
@@ -740,38 +960,26 @@ class MergePartialSubgraph(BFSGraphVisit):
         Case (3) is trivial to handle, the vertex is moved to the merged
         graph and the edges are recreated.
         """
+        self._examine_vertex_index(int(u), lambda index: u)
+
+    def _examine_vertex_index(self, index, vertex):
+        """
+        Merge the subgraph vertex with the given index,
+        see :meth:`examine_vertex`.
+        The omit and dispatch checks only need the vertex index, the
+        vertex handle is fetched when the vertex is actually merged.
+
+        :param index: index of the vertex in the subgraph
+        :param vertex: function that returns the vertex handle for an index
+        """
         self.progress.advance()
-        if self.omit_vertex_map[u]:
+        if self._omit_vertex_array[index]:
             # nothing to do for this vertex, it is marked to be omitted
             return
 
-        if self.context.step_idx == 0:
-            # merge initial and normal vertices but ignore the vertex memory map
-            if u in self.curr_regset.initial_reg_nodes:
-                logger.debug("Merge initial vertex subgraph:%s", u)
-                self._merge_initial_vertex(u)
-            else:
-                logger.debug("Merge normal vertex subgraph:%s", u)
-                self._merge_subgraph_vertex(u)
-        else:
-            # handle syscall merges
-            if u == self.context.curr_pcc_fixup["epcc"]:
-                self._merge_pcc_fixup(u)
-            if u == self.context.curr_syscall["eret_cap"]:
-                self._merge_syscall(u)
-            # merge vertices
-            if u == self.context.curr_callgraph["root"]:
-                logger.debug("Merge call graph root subgraph:%s", u)
-                self._merge_callgraph(u)
-            elif u in self.curr_regset.initial_reg_nodes:
-                logger.debug("Merge initial vertex subgraph:%s", u)
-                self._merge_initial_vertex(u)
-            elif u in self.vertex_map.initial_map.values():
-                logger.debug("Merge initial mem vertex subgraph:%s", u)
-                self._merge_initial_mem_vertex(u)
-            else:
-                logger.debug("Merge normal vertex subgraph:%s", u)
-                self._merge_subgraph_vertex(u)
+        # vertices that are not in the dispatch table are case (3)
+        handler = self._vertex_handlers.get(index, self._merge_subgraph_vertex)
+        handler(vertex(index))
 
 
 class CapabilityBranchSubparser:
@@ -810,9 +1018,9 @@ class CapabilityBranchSubparser:
         self._initial_badvaddr = None
         """First badvaddr fetched for which we did not see the exception."""
 
-        self._saved_epcc_out_neighbours = None
+        self._saved_epcc_out_degree = None
         """
-        Saved out neighbours of the jmp target so that we can
+        Saved out degree of the jmp target so that we can
         detect anything appended to it.
         """
 
@@ -827,24 +1035,17 @@ class CapabilityBranchSubparser:
         Return partial result from worker subparser
         """
         # serialize vertex index, not object
-        try:
-            saved_pcc = int(self._saved_pcc)
-        except TypeError:
-            saved_pcc = None
-        try:
-            epcc_neighbours = [int(u) for u in self._saved_epcc_out_neighbours]
-        except TypeError:
-            epcc_neighbours = None
-
-        try:
-            epcc = int(self._initial_epcc)
-        except TypeError:
-            epcc = None
+        saved_pcc = self._saved_pcc
+        if saved_pcc is not None:
+            saved_pcc = int(saved_pcc)
+        epcc = self._initial_epcc
+        if epcc is not None:
+            epcc = int(epcc)
 
         state = {
             "saved_addr": self._saved_addr,
             "saved_pcc": saved_pcc,
-            "epcc_out_neighbours": epcc_neighbours,
+            "epcc_out_degree": self._saved_epcc_out_degree,
             "epcc": epcc,
             "badvaddr": self._initial_badvaddr,
         }
@@ -859,25 +1060,26 @@ class CapabilityBranchSubparser:
         """
         if self.parser.paused:
             return False
-        if self._saved_addr != None:
+        saved_addr = self._saved_addr
+        is_badvaddr = inst.op1.gpr_index == 8
+        if saved_addr != None:
             self._save_first_mfc = False
-            # badvaddr
-            if inst.op1.gpr_index == 8:
+            if is_badvaddr:
                 badvaddr = inst.op0.value
-                if (badvaddr == self._saved_addr or
-                    badvaddr == self._saved_addr + 4):
+                if badvaddr == saved_addr or badvaddr == saved_addr + 4:
                     # not committed, epcc = pcc_before_jmp
                     # XXX this assumes that nothing as been done with epcc
                     # between the exception and the mfc0 instruction
-                    assert (self.regset.get_epcc().out_degree() ==
-                            len(self._saved_epcc_out_neighbours))
+                    assert (self.parser.out_degree(self.regset.get_epcc()) ==
+                            self._saved_epcc_out_degree)
                     # unregister the free-time of the saved_pcc since it was not
                     # really out of scope.
-                    data = self.pgm.data[self._saved_pcc]
+                    saved_pcc = self._saved_pcc
+                    data = self.pgm.data[saved_pcc]
                     data.cap.t_free = -1
-                    self.regset.set_epcc(self._saved_pcc, entry.cycles)
+                    self.regset.set_epcc(saved_pcc, entry.cycles)
             self._saved_addr = None
-        elif self._save_first_mfc and inst.op1.gpr_index == 8:
+        elif self._save_first_mfc and is_badvaddr:
             self._save_first_mfc = False
             self._initial_badvaddr = inst.op0.value
             self._initial_epcc = self.regset.get_epcc()
@@ -897,7 +1099,7 @@ class CapabilityBranchSubparser:
         self._save_first_mfc = False
         self._saved_pcc = self.regset.get_pcc()
         self._saved_addr = entry.pc
-        self._saved_epcc_out_neighbours = list(branch_target.out_neighbours())
+        self._saved_epcc_out_degree = self.parser.out_degree(branch_target)
 
     def scan_delay_slot(self, inst, entry, regs, last_regs, idx):
         """
@@ -955,15 +1157,18 @@ class CapabilityBranchSubparser:
         so that if the instruction did not commit, epcc can
         be set to the correct pcc.
         """
+        regset = self.regset
+        op0 = inst.op0
+        cycles = entry.cycles
         # discard current pcc and replace it
-        if self.regset.has_reg(inst.op0.cap_index, inst.op0.value, entry.cycles):
+        new_pcc = regset.lookup_reg(op0.cap_index, op0.value, cycles)
+        if new_pcc is not None:
             # we already have a node for the new PCC
-            new_pcc = self.regset.get_reg(inst.op0.cap_index)
             if inst.has_exception:
                 self._save_branch_state(entry, new_pcc)
-            self.regset.set_pcc(new_pcc, entry.cycles)
-            pcc_data = self.pgm.data[self.regset.get_pcc()]
-            if not pcc_data.cap.has_perm(CheriCapPerm.EXEC):
+            regset.set_pcc(new_pcc, cycles)
+            pcc_data = self.pgm.data[new_pcc]
+            if not pcc_data.cap.permissions & _PERM_EXEC:
                 logger.error("Loading PCC without exec permissions? %s %s",
                              inst, pcc_data)
                 raise UnexpectedOperationError(
@@ -984,26 +1189,28 @@ class CapabilityBranchSubparser:
         op0 is the link register
         op1 is the target register
         """
+        regset = self.regset
+        op0 = inst.op0
+        op1 = inst.op1
+        cycles = entry.cycles
         # save current pcc
-        cd_idx = inst.op0.cap_index
-        if not self.regset.has_pcc(inst.op0.value, entry.cycles,
-                                   allow_root=True):
+        cd_idx = op0.cap_index
+        old_pcc_node = regset.lookup_pcc(op0.value, cycles, allow_root=True)
+        if old_pcc_node is None:
             # create a root node for PCC that is in cd
-            old_pcc_node = self.parser.make_root_node(entry, inst.op0.value,
-                                                      time=entry.cycles)
-        else:
-            old_pcc_node = self.regset.get_pcc()
-        self.regset.set_reg(cd_idx, old_pcc_node, entry.cycles)
+            old_pcc_node = self.parser.make_root_node(entry, op0.value,
+                                                      time=cycles)
+        regset.set_reg(cd_idx, old_pcc_node, cycles)
 
         # discard current pcc and replace it
-        if self.regset.has_reg(inst.op1.cap_index, inst.op1.value, entry.cycles):
+        new_pcc = regset.lookup_reg(op1.cap_index, op1.value, cycles)
+        if new_pcc is not None:
             # we already have a node for the new PCC
-            new_pcc = self.regset.get_reg(inst.op1.cap_index)
             if inst.has_exception:
                 self._save_branch_state(entry, new_pcc)
-            self.regset.set_pcc(new_pcc, entry.cycles)
-            pcc_data = self.pgm.data[self.regset.get_pcc()]
-            if not pcc_data.cap.has_perm(CheriCapPerm.EXEC):
+            regset.set_pcc(new_pcc, cycles)
+            pcc_data = self.pgm.data[new_pcc]
+            if not pcc_data.cap.permissions & _PERM_EXEC:
                 logger.error("Loading PCC without exec permissions? %s %s",
                              inst, pcc_data)
                 raise UnexpectedOperationError(
@@ -1093,10 +1300,9 @@ class SyscallSubparser:
         """
 
     def mp_result(self):
-        try:
-            eret_cap_idx = int(self.initial_eret_cap)
-        except TypeError:
-            eret_cap_idx = None
+        eret_cap_idx = self.initial_eret_cap
+        if eret_cap_idx is not None:
+            eret_cap_idx = int(eret_cap_idx)
         result = {
             "code": self.code,
             "active": self.in_syscall,
@@ -1135,15 +1341,20 @@ class SyscallSubparser:
         """
         When an exception occurs, adjust the epcc vertex from pcc.
         """
-        self.exception_depth += 1
-        logger.debug("except {%d}: update epcc %s, update pcc %s",
-                     entry.cycles,
-                     self.pgm.data[self.regset.get_pcc()],
-                     self.pgm.data[self.regset.get_kcc()])
+        # exception_depth is not tracked while the eret matching
+        # is disabled, see scan_eret
+        regset = self.regset
+        cycles = entry.cycles
+        pcc = regset.get_pcc()
+        kcc = regset.get_kcc()
+        if logger.isEnabledFor(logging.DEBUG):
+            data = self.pgm.data
+            logger.debug("except {%d}: update epcc %s, update pcc %s",
+                         cycles, data[pcc], data[kcc])
         # saved pcc
-        self.regset.set_epcc(self.regset.get_pcc(), entry.cycles)
+        regset.set_epcc(pcc, cycles)
         # pcc <- kcc
-        self.regset.set_pcc(self.regset.get_kcc(), entry.cycles)
+        regset.set_pcc(kcc, cycles)
         return False
 
     # def scan_syscall(self, inst, entry, regs, last_regs, idx):
@@ -1200,10 +1411,11 @@ class SyscallSubparser:
         #                  self.code, data)
         #     data.add_use_syscall(entry.cycles, self.code, False)
 
-        logger.debug("eret {%d}: update pcc %s, update kcc %s",
-                     entry.cycles,
-                     self.pgm.data[self.regset.get_epcc()],
-                     self.pgm.data[self.regset.get_pcc()])
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("eret {%d}: update pcc %s, update kcc %s",
+                         entry.cycles,
+                         self.pgm.data[self.regset.get_epcc()],
+                         self.pgm.data[self.regset.get_pcc()])
         # restore saved pcc
         self.regset.set_pcc(self.regset.get_epcc(), entry.cycles)
         return False
@@ -1305,6 +1517,18 @@ class PointerProvenanceSubparser:
         self.grab_out_pcb = False
         self.paused = False
 
+        self._pending_edges = array("q")
+        """
+        Provenance edges (parent, child) created by :meth:`make_node`
+        that are added to the graph in bulk by :meth:`flush_edges`.
+        The vertex index pairs are packed in a flat growable array,
+        so queuing an edge does not allocate a python object.
+        While the parse is running the graph misses these edges,
+        the subparsers must query the provenance edges through
+        :meth:`out_degree` and :meth:`out_neighbours`, which flush
+        the pending edges first.
+        """
+
     def pause_all(self):
         self.paused = True
 
@@ -1322,12 +1546,46 @@ class PointerProvenanceSubparser:
 
         :return: dict
         """
+        self.flush_edges()
         state = {
             "regset": self.regset,
             "mem_vertex_map": self.vertex_map,
         }
         return state
 
+    def flush_edges(self):
+        """
+        Add the pending provenance edges to the graph.
+        This must be called before the provenance edges are inspected,
+        the result of the worker calls it before handing the graph
+        over to the merge.
+        """
+        if self._pending_edges:
+            edges = np.frombuffer(self._pending_edges, dtype=np.int64)
+            self.pgm.graph.add_edge_list(edges.reshape(-1, 2))
+            self._pending_edges = array("q")
+
+    def out_degree(self, vertex):
+        """
+        Return the out degree of a vertex during the parse.
+
+        :param vertex: the graph vertex
+        :return: number of out-edges, including the pending ones
+        """
+        self.flush_edges()
+        return self.pgm.graph.vertex(vertex).out_degree()
+
+    def out_neighbours(self, vertex):
+        """
+        Return the out neighbours of a vertex during the parse.
+
+        :param vertex: the graph vertex
+        :return: list of vertices, including the targets of
+        the pending edges
+        """
+        self.flush_edges()
+        return list(self.pgm.graph.vertex(vertex).out_neighbours())
+
     def maybe_scan(self, cbk, addr):
         """
         Register a scan callback to be invoked later depending
@@ -1509,35 +1767,36 @@ class PointerProvenanceSubparser:
         # offset the index by 32 because the first
         # 32 entries are GP capability registers
         hwreg_num = op_hwr.caphw_index + 32
-        src_data = self.pgm.data[self.regset.get_reg(hwreg_num)]
+        regset = self.regset
+        reg_nodes = regset.reg_nodes
+        src_data = self.pgm.data[reg_nodes[hwreg_num]]
         dst = op_dst.value
 
-        if dst is None and src_data.origin == CheriNodeOrigin.PARTIAL:
+        if dst is None and src_data.origin == _ORIGIN_PARTIAL:
             logger.debug("Unknown register content unchanged %s", inst)
             return
 
-        if not self.regset.has_reg(hwreg_num, op_dst.value, entry.cycles,
-                                   allow_root=True):
+        node = regset.lookup_reg(hwreg_num, dst, entry.cycles, allow_root=True)
+        if node is None:
             # no node was ever created for the register, it contained something
             # invalid
-            node = self.make_root_node(entry, op_dst.value, time=entry.cycles)
-            self.regset.set_reg(hwreg_num, node, entry.cycles)
-            logger.debug("cpreg_get: new node from $chwr%d %s",
-                         op_hwr.caphw_index, self.pgm.data[node])
+            node = self.make_root_node(entry, dst, time=entry.cycles)
+            regset.set_reg(hwreg_num, node, entry.cycles)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("cpreg_get: new node from $chwr%d %s",
+                             op_hwr.caphw_index, self.pgm.data[node])
         # consistency checks
         if dst is not None:
             # these are performed only if the dst register in the entry
             # is valid, if not the register was probably unchanged and
             # we know the value because we picked it up from another
             # readhwr
-            src_data = self.pgm.data[self.regset.get_reg(hwreg_num)]
+            src_data = self.pgm.data[node]
             assert src_data.cap.base == dst.base, "{} {}".format(src_data, inst)
             assert src_data.cap.length == dst.length, "{} {}".format(src_data, inst)
             assert (src_data.cap.permissions == \
                     CheriCapPerm(dst.permissions)), "{} {}".format(src_data, inst)
-        self.regset.set_reg(op_dst.cap_index,
-                            self.regset.get_reg(hwreg_num),
-                            entry.cycles)
+        regset.set_reg(op_dst.cap_index, node, entry.cycles)
 
     def _handle_cpreg_set(self, op_hwr, op_src, entry):
         """
@@ -1553,17 +1812,18 @@ class PointerProvenanceSubparser:
         :parm entry: trace entry
         :type entry: :class:`pycheritrace.trace_entry`
         """
-        if not self.regset.has_reg(op_src.cap_index, op_src.value,
-                                   entry.cycles, allow_root=True):
+        regset = self.regset
+        node = regset.lookup_reg(op_src.cap_index, op_src.value,
+                                 entry.cycles, allow_root=True)
+        if node is None:
             node = self.make_root_node(entry, op_hwr.value, time=entry.cycles)
-            self.regset.set_reg(op_src.cap_index, node, entry.cycles)
-            logger.debug("cpreg_set: new node from $chwr<%d> %s",
-                         op_hwr.caphw_index, self.pgm.data[node])
+            regset.set_reg(op_src.cap_index, node, entry.cycles)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("cpreg_set: new node from $chwr<%d> %s",
+                             op_hwr.caphw_index, self.pgm.data[node])
         # offset the index by 32 because the first
         # 32 entries are GP capability registers
-        self.regset.set_reg(op_hwr.caphw_index + 32,
-                            self.regset.get_reg(op_src.cap_index),
-                            entry.cycles)
+        regset.set_reg(op_hwr.caphw_index + 32, node, entry.cycles)
 
     def scan_cgetnull(self, inst, entry, regs, last_regs, idx):
         """
@@ -1579,15 +1839,17 @@ class PointerProvenanceSubparser:
     def scan_cgetpcc(self, inst, entry, regs, last_regs, idx):
         if self.paused:
             return False
-        if not self.regset.has_pcc(inst.op0.value, entry.cycles,
-                                   allow_root=True):
+        node = self.regset.lookup_pcc(inst.op0.value, entry.cycles,
+                                      allow_root=True)
+        if node is None:
             # never seen anything in pcc so we create a new node
             node = self.make_root_node(entry, inst.op0.value,
                                        time=entry.cycles)
             self.regset.set_pcc(node, entry.cycles)
-            logger.debug("cgetpcc: new node from pcc %s",
-                         self.pgm.data[node])
-        data = self.pgm.data[self.regset.get_pcc()]
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("cgetpcc: new node from pcc %s",
+                             self.pgm.data[node])
+        data = self.pgm.data[node]
         assert data.cap.base == inst.op0.value.base,\
             "{} {}".format(data, inst)
         assert data.cap.length == inst.op0.value.length,\
@@ -1599,10 +1861,9 @@ class PointerProvenanceSubparser:
                             entry.cycles)
         return False
 
-    def scan_cgetpccsetoffset(self, inst, entry, regs, last_regs, idx):
-        if self.paused:
-            return False
-        return self.scan_cgetpcc(inst, entry, regs, last_regs, idx)
+    # cgetpccsetoffset is handled exactly as cgetpcc, alias the callback
+    # instead of wrapping it to avoid an extra call frame per instruction
+    scan_cgetpccsetoffset = scan_cgetpcc
 
     def scan_csetbounds(self, inst, entry, regs, last_regs, idx, maybe_call=False):
         """
@@ -1627,12 +1888,33 @@ class PointerProvenanceSubparser:
         self.regset.set_reg(inst.op0.cap_index, node, entry.cycles)
         return False
 
+    def _clear_untagged_result(self, inst, entry):
+        """
+        Clear the destination register of an instruction that derives
+        an untagged capability, e.g. cfromptr of a NULL pointer.
+        An untagged capability can not be used to access memory or to
+        derive other capabilities, so no vertex is created for it.
+        This is the same as the capability arithmetic instructions,
+        see :meth:`scan_cap_arith`.
+
+        :return: True if the destination register has been cleared
+        """
+        dst = inst.op0
+        dst_value = dst.value
+        if dst_value is None or dst_value.valid:
+            return False
+        self.regset.set_reg(dst.cap_index, None, entry.cycles)
+        return True
+
     def scan_cfromptr(self, inst, entry, regs, last_regs, idx, maybe_call=False):
         """
         Each cfromptr is a new pointer allocation and is
         recodred as a new node in the provenance tree.
         The destination register is associated to the new node
         in the register set.
+        If the result is untagged (e.g. cfromptr of NULL) no node is
+        created and the destination register is cleared,
+        see :meth:`_clear_untagged_result`.
         Note cfromddc is also encoded as a cfromptr but the source register c0
         is treated as chwr_ddc.
 
@@ -1648,6 +1930,8 @@ class PointerProvenanceSubparser:
                         last_regs, idx, True),
                 entry.pc)
             return False
+        if self._clear_untagged_result(inst, entry):
+            return False
         if inst.op1.cap_index == -1 and inst.op1.caphw_index == 0:
             # cfromddc variant, src_reg_index=chwr_ddc
             node = self.make_node(entry, inst, origin=CheriNodeOrigin.FROMPTR,
@@ -1663,6 +1947,8 @@ class PointerProvenanceSubparser:
         """
         Each candperm is a new pointer allocation and is recorded
         as a new node in the provenance tree.
+        If the result is untagged no node is created and the destination
+        register is cleared, see :meth:`_clear_untagged_result`.
 
         candperm:
         Operand 0 is the register with the new node
@@ -1676,6 +1962,8 @@ class PointerProvenanceSubparser:
                         last_regs, idx, True),
                 entry.pc)
             return False
+        if self._clear_untagged_result(inst, entry):
+            return False
         node = self.make_node(entry, inst, origin=CheriNodeOrigin.ANDPERM)
         self.regset.set_reg(inst.op0.cap_index, node, entry.cycles)
         return False
@@ -1695,7 +1983,7 @@ class PointerProvenanceSubparser:
         dst = inst.op0
         src = inst.op1
         assert dst.is_capability and src.is_capability
-        if CheriCap(dst.value) == CheriCap(src.value) and inst.op2.value != 0:
+        if inst.op2.value != 0 and _cap_register_equal(dst.value, src.value):
             # conditional move occurred
             self.scan_cap_arith(inst, entry, regs, last_regs, idx)
         return False
@@ -1715,7 +2003,7 @@ class PointerProvenanceSubparser:
         dst = inst.op0
         src = inst.op1
         assert dst.is_capability and src.is_capability
-        if CheriCap(dst.value) == CheriCap(src.value) and inst.op2.value == 0:
+        if inst.op2.value == 0 and _cap_register_equal(dst.value, src.value):
             # conditional move occurred
             self.scan_cap_arith(inst, entry, regs, last_regs, idx)
         return False
@@ -1739,19 +2027,22 @@ class PointerProvenanceSubparser:
         src = inst.op1
 
         if dst and dst.is_capability:
+            regset = self.regset
+            cycles = entry.cycles
+            dst_index = dst.cap_index
+            dst_value = dst.value
             if src and src.is_capability:
                 # use dst.value because it is the only one guaranteed
                 # to be up to date with the current trace entry.
-                src_vertex = self.regset.has_reg(src.cap_index, dst.value,
-                                                 entry.cycles, allow_root=True)
+                reg_src = regset.lookup_reg(src.cap_index, dst_value,
+                                            cycles, allow_root=True)
             else:
-                src_vertex = False
+                reg_src = None
 
-            if src_vertex:
+            if reg_src is not None:
                 # XXX this is a good place to add a safety-check
                 # to validate the fact that the vertex in the regset
                 # is compatible with the destination.
-                reg_src = self.regset.get_reg(src.cap_index)
                 # XXX-AM: temporarily disabled due to a suspected qemu bug
                 # if reg_src is not None and src.value is not None:
                 #     src_data = self.pgm.data[reg_src]
@@ -1762,20 +2053,18 @@ class PointerProvenanceSubparser:
                 #     assert (src_data.cap.permissions == \
                 #             CheriCapPerm(dst.value.permissions)),\
                 #             "{} {}".format(src_data, inst)
-                self.regset.set_reg(dst.cap_index,
-                                    self.regset.get_reg(src.cap_index),
-                                    entry.cycles)
+                regset.set_reg(dst_index, reg_src, cycles)
             else:
-                if dst.value.valid:
-                    if regs.valid_caps[dst.cap_index]:
+                if dst_value.valid:
+                    if regs.valid_caps[dst_index]:
                         # a register that was invalid has become valid, create a
                         # root for it.
                         dst_vertex = self.make_root_node(
-                            entry, dst.value, pc=entry.pc, time=entry.cycles)
-                        self.regset.set_reg(src.cap_index, dst_vertex, entry.cycles)
-                        self.regset.set_reg(dst.cap_index, dst_vertex, entry.cycles)
+                            entry, dst_value, pc=entry.pc, time=cycles)
+                        regset.set_reg(src.cap_index, dst_vertex, cycles)
+                        regset.set_reg(dst_index, dst_vertex, cycles)
                 else:
-                    self.regset.set_reg(dst.cap_index, None, entry.cycles)
+                    regset.set_reg(dst_index, None, cycles)
         return False
 
     def _handle_dereference(self, inst, entry, ptr_reg, maybe_call=False):
@@ -1792,13 +2081,7 @@ class PointerProvenanceSubparser:
                 entry.memory_address)
             return
 
-        try:
-            node = self.regset.get_reg(ptr_reg)
-        except KeyError:
-            logger.error("{%d} Dereference unknown capability %s",
-                         entry.cycles, inst)
-            raise DereferenceUnknownCapabilityError(
-                "Dereference unknown capability")
+        node = self.regset.get_reg(ptr_reg)
         if node is None:
             logger.error("{%d} Dereference unknown capability %s",
                          entry.cycles, inst)
@@ -1808,15 +2091,16 @@ class PointerProvenanceSubparser:
         # instead of the capability register offset we use the
         # entry memory_address so we capture any extra offset in
         # the instruction as well
-        is_cap = (inst.opcode.startswith("clc") or inst.opcode == "csc" or
-                  inst.opcode == "cscbi")
+        is_cap = inst.opcode in _CAP_SIZED_MEMOP
 
+        # call add_deref directly, the add_deref_* partial methods
+        # build a new partial object on each access
         if entry.is_load:
-            node_data.add_deref_load(entry.cycles, entry.memory_address,
-                                     entry.is_kernel(), is_cap)
+            node_data.add_deref(entry.cycles, entry.memory_address,
+                                entry.is_kernel(), is_cap, _EVENT_DEREF_LOAD)
         elif entry.is_store:
-            node_data.add_deref_store(entry.cycles, entry.memory_address,
-                                      entry.is_kernel(), is_cap)
+            node_data.add_deref(entry.cycles, entry.memory_address,
+                                entry.is_kernel(), is_cap, _EVENT_DEREF_STORE)
         else:
             if not inst.has_exception:
                 logger.warning("Dereference is neither a load or a store %s, "
@@ -1825,45 +2109,30 @@ class PointerProvenanceSubparser:
     def scan_cap_load(self, inst, entry, regs, last_regs, idx, maybe_call=False):
         """
         Store all offsets at time of dereference of a given capability.
-
-        clX[u] have pointer argument in op3
-        clXr and clXi have pointer argument in op2
-        cllX have pointer argument in op1
+        See :func:`_cap_load_ptr_operand` for the pointer operand.
         """
         if self.paused:
             return False
         # get the register with the address capability
         # this may be a normal capability load or a linked-load
-        if inst.opcode.startswith("cll"):
-            ptr_reg = inst.op1.cap_index
-        else:
-            if inst.opcode[-1] == "r" or inst.opcode[-1] == "i":
-                ptr_reg = inst.op2.cap_index
-            else:
-                ptr_reg = inst.op3.cap_index
+        # only registered for the I_CAP_LOAD opcodes, always in the table
+        ptr_operand = _CAP_LOAD_PTR_OPERAND[inst.opcode]
+        ptr_reg = getattr(inst, ptr_operand).cap_index
         self._handle_dereference(inst, entry, ptr_reg)
         return False
 
     def scan_cap_store(self, inst, entry, regs, last_regs, idx):
         """
         Store all offsets at time of dereference of a given capability.
-
-        csX have pointer argument in op3
-        csXr and csXi have pointer argument in op2
-        cscX conditionals use op2
+        See :func:`_cap_store_ptr_operand` for the pointer operand.
         """
         if self.paused:
             return False
         # get the register with the address capability
         # this may be a normal capability store or an atomic-store
-        if inst.opcode != "csc" and inst.opcode.startswith("csc"):
-            # atomic
-            ptr_reg = inst.op2.cap_index
-        else:
-            if inst.opcode[-1] == "r" or inst.opcode[-1] == "i":
-                ptr_reg = inst.op2.cap_index
-            else:
-                ptr_reg = inst.op3.cap_index
+        # only registered for the I_CAP_STORE opcodes, always in the table
+        ptr_operand = _CAP_STORE_PTR_OPERAND[inst.opcode]
+        ptr_reg = getattr(inst, ptr_operand).cap_index
         self._handle_dereference(inst, entry, ptr_reg)
         return False
 
@@ -1887,7 +2156,8 @@ class PointerProvenanceSubparser:
         if inst.opcode != "csc":
             # csc stores a new vertex, we do not have access to that
             # here, so handle that case separately in scan_csc
-            self.mem_overwrite(entry, entry.cycles, entry.memory_address, None)
+            self.mem_overwrite(entry.is_kernel(), entry.cycles,
+                               entry.memory_address, None)
         return False
 
     def scan_clc(self, inst, entry, regs, last_regs, idx, maybe_call=False):
@@ -1908,40 +2178,52 @@ class PointerProvenanceSubparser:
                 entry.memory_address)
             return False
 
-        cd = inst.op0.cap_index
-        node = self.vertex_map.mem_load(entry.memory_address)
-        if node is None:
+        # fetch the trace entry fields once, each access goes
+        # through the pycheritrace bindings
+        cycles = entry.cycles
+        mem_addr = entry.memory_address
+        op0 = inst.op0
+        cd = op0.cap_index
+        value = op0.value
+        regset = self.regset
+        vertex_map = self.vertex_map
+        vertex_data = self.pgm.data
+        debug = logger.isEnabledFor(logging.DEBUG)
+        node = vertex_map.mem_load(mem_addr)
+        if node is None and debug:
             logger.debug("{%d} Load c%d from new location 0x%x",
-                         idx, cd, entry.memory_address)
-        if not inst.op0.value.valid:
+                         idx, cd, mem_addr)
+        if not value.valid:
             # if the value is invalid we don't care about what we found,
             # it is overwritten anyway.
-            logger.debug("{%d} clc load invalid, clear memory vertex map", idx)
-            self.regset.set_reg(cd, None, entry.cycles)
+            if debug:
+                logger.debug("{%d} clc load invalid, clear memory vertex map",
+                             idx)
+            regset.set_reg(cd, None, cycles)
             if node is not None:
-                self.vertex_map.clear(entry.memory_address)
+                vertex_map.clear(mem_addr)
         else:
-            if node is None or not self.regset._is_cap_compatible(
-                    self.pgm.data[node], inst.op0.value):
+            node_data = vertex_data[node] if node is not None else None
+            if node is None or not regset._is_cap_compatible(
+                    node_data, value):
                 # add a node as a root node because we have never
                 # seen the content of this register yet.
-                node = self.make_root_node(entry, inst.op0.value,
-                                           time=entry.cycles)
-                node_data = self.pgm.data[node]
-                logger.debug("{%d} Found %s value %s from memory load",
-                             idx, inst.op0.name, node_data)
-                self.vertex_map.mem_load(entry.memory_address, node)
+                node = self.make_root_node(entry, value, time=cycles)
+                node_data = vertex_data[node]
+                if debug:
+                    logger.debug("{%d} Found %s value %s from memory load",
+                                 idx, op0.name, node_data)
+                vertex_map.mem_load(mem_addr, node)
 
-            node_data = self.pgm.data[node]
             # XXX check that the loaded cap matches with the expected value
-            assert node_data.cap.base == inst.op0.value.base, (node_data, inst)
-            assert node_data.cap.length == inst.op0.value.length, (node_data, inst)
-            assert (node_data.cap.permissions == \
-                    CheriCapPerm(inst.op0.value.permissions)),\
+            node_cap = node_data.cap
+            assert node_cap.base == value.base, (node_data, inst)
+            assert node_cap.length == value.length, (node_data, inst)
+            assert (node_cap.permissions == \
+                    CheriCapPerm(value.permissions)),\
                     "{} {}".format(node_data, inst)
-            node_data.add_mem_load(entry.cycles, entry.memory_address,
-                                   entry.is_kernel())
-            self.regset.set_reg(cd, node, entry.cycles)
+            node_data.add_mem_load(cycles, mem_addr, entry.is_kernel())
+            regset.set_reg(cd, node, cycles)
         return False
 
     scan_clcr = scan_clc
@@ -1974,31 +2256,36 @@ class PointerProvenanceSubparser:
                 entry.memory_address)
             return False
 
-        cd = inst.op0.cap_index
-        if inst.op0.value.valid:
+        op0 = inst.op0
+        cd = op0.cap_index
+        value = op0.value
+        if value.valid:
             # if this is not a data access
-
-            if not self.regset.has_reg(cd, inst.op0.value, entry.cycles,
-                                       allow_root=True):
+            # fetch the trace entry fields once, each access goes
+            # through the pycheritrace bindings
+            cycles = entry.cycles
+            mem_addr = entry.memory_address
+            is_kernel = entry.is_kernel()
+            regset = self.regset
+
+            node = regset.lookup_reg(cd, value, cycles, allow_root=True)
+            if node is None:
                 # XXX may decide to disable and have an exception here
                 # need to create one
-                node = self.make_root_node(entry, inst.op0.value,
-                                           time=entry.cycles)
-                self.regset.set_reg(cd, node, entry.cycles)
-                logger.debug("{%d} Found %s value %s from memory store",
-                             idx, inst.op0.name, node)
-            else:
-                node = self.regset.get_reg(cd)
+                node = self.make_root_node(entry, value, time=cycles)
+                regset.set_reg(cd, node, cycles)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("{%d} Found %s value %s from memory store",
+                                 idx, op0.name, node)
 
-            self.mem_overwrite(entry, entry.cycles, entry.memory_address, node)
+            self.mem_overwrite(is_kernel, cycles, mem_addr, node)
             # if there is a node associated with the register that is
             # being stored, save it in the memory_map for the memory location
             # written by csc
-            self.vertex_map.mem_store(entry.memory_address, node)
+            self.vertex_map.mem_store(mem_addr, node)
             # set the address attribute of the node vertex data property
             node_data = self.pgm.data[node]
-            node_data.add_mem_store(entry.cycles, entry.memory_address,
-                                    entry.is_kernel())
+            node_data.add_mem_store(cycles, mem_addr, is_kernel)
 
         return False
 
@@ -2006,12 +2293,17 @@ class PointerProvenanceSubparser:
     scan_csci = scan_csc
     scan_cscbi = scan_csc
 
-    def mem_overwrite(self, entry, time, addr, new_vertex):
+    def mem_overwrite(self, is_kernel, time, addr, new_vertex):
         """
         Register the removal of anything contained at the given address,
         if the address is not capability-size aligned, it is aligned here.
         If the vertex removed is not live in other memory locations
         or in the register set, mark it out of scope.
+
+        :param is_kernel: the trace entry is in kernel mode
+        :param time: time of the overwrite
+        :param addr: memory address overwritten
+        :param new_vertex: vertex stored at the address, if any
         """
         if self.paused:
             return False
@@ -2019,8 +2311,8 @@ class PointerProvenanceSubparser:
         v = self.vertex_map.vertex_at(addr)
         if v != None and v != new_vertex:
             v_data = self.pgm.data[v]
-            v_data.add_mem_del(time, addr, entry.is_kernel())
-            if v in self.regset.reg_nodes or v_data.has_active_memory():
+            v_data.add_mem_del(time, addr, is_kernel)
+            if self.regset.is_live(v) or v_data.has_active_memory():
                 return
             else:
                 v_data.cap.t_free = time
@@ -2050,9 +2342,10 @@ class PointerProvenanceSubparser:
         data.is_kernel = entry.is_kernel()
 
         # create graph vertex and assign the data to it
-        vertex = self.pgm.graph.add_vertex()
-        self.pgm.data[vertex] = data
-        self.pgm.layer_prov[vertex] = True
+        pgm = self.pgm
+        vertex = pgm.graph.add_vertex()
+        pgm.data[vertex] = data
+        pgm.layer_prov[vertex] = True
         return vertex
 
     def make_node(self, entry, inst, origin=None, src_op_index=1, dst_op_index=0, src_reg_index=None):
@@ -2085,6 +2378,8 @@ class PointerProvenanceSubparser:
         :return: the new node
         :rtype: :class:`graph_tool.Vertex`
         """
+        regset = self.regset
+        reg_nodes = regset.reg_nodes
         data = ProvenanceVertexData.from_operand(inst.operands[dst_op_index])
         data.origin = origin
         # try to get a parent node
@@ -2094,23 +2389,16 @@ class PointerProvenanceSubparser:
             src_expect = op.value
         else:
             src_index = src_reg_index
-            src_expect = self.regset.get_reg(src_index)
-
-        if self.regset.has_reg(src_index, src_expect, entry.cycles,
-                               allow_root=False):
-            parent = self.regset.get_reg(src_index)
-        else:
-            logger.error("Missing parent for %s, src_operand=%d %s, "
-                         "dst_operand=%d %s", data,
-                         src_op_index, inst.operands[src_op_index],
-                         dst_op_index, inst.operands[dst_op_index])
-            raise MissingParentError("Missing parent for %s" % data)
+            src_expect = reg_nodes[src_index]
 
         # there must be a parent if the root nodes for the initial register
-        # set have been created
+        # set have been created, lookup_reg guarantees that the register
+        # is not empty when it succeeds.
         # Note that we may chose to add a root node when no parent is
         # available, this may be the case of replacing the guess of KDC
-        if parent == None:
+        parent = regset.lookup_reg(src_index, src_expect, entry.cycles,
+                                   allow_root=False)
+        if parent is None:
             logger.error("Missing parent for %s, src_operand=%d %s, "
                          "dst_operand=%d %s", data,
                          src_op_index, inst.operands[src_op_index],
@@ -2118,7 +2406,8 @@ class PointerProvenanceSubparser:
             raise MissingParentError("Missing parent for %s" % data)
 
         # sanity check monotonicity
-        pdata = self.pgm.data[parent]
+        pgm = self.pgm
+        pdata = pgm.data[parent]
         if (pdata.cap.valid and data.cap.valid and (
                 pdata.cap.base > data.cap.base or pdata.cap.bound < data.cap.bound or
                 data.cap.permissions & ~pdata.cap.permissions)):
@@ -2126,10 +2415,12 @@ class PointerProvenanceSubparser:
                          entry.cycles, pdata, data)
             raise UnexpectedOperationError("Monotonicity violation")
         # create the vertex in the graph and assign the data to it
-        vertex = self.pgm.graph.add_vertex()
-        self.pgm.graph.add_edge(parent, vertex)
-        self.pgm.data[vertex] = data
-        self.pgm.layer_prov[vertex] = True
+        vertex = pgm.graph.add_vertex()
+        # the edge is only needed when the graph is inspected,
+        # defer it so that the edges are added in bulk
+        self._pending_edges.extend((int(parent), int(vertex)))
+        pgm.data[vertex] = data
+        pgm.layer_prov[vertex] = True
         return vertex
 
 
@@ -2400,7 +2691,7 @@ class CallgraphSubparser:
             # recorded the update.
             if (not epcc_valid and
                 (epcc_vertex is None or
-                 self.pgm.data[epcc_vertex].origin == CheriNodeOrigin.PARTIAL)):
+                 self.pgm.data[epcc_vertex].origin == _ORIGIN_PARTIAL)):
                 msg = "eret without valid epcc register %s" % inst
                 logger.error(msg)
                 raise UnexpectedOperationError(msg)
@@ -2615,4 +2906,7 @@ class CheriMipsModelParser(CheriplotModelParser):
         state["sub_pcc_fixup"] = self._cap_branch.mp_result()
         state["sub_syscall"] = self._syscall_subparser.mp_result()
         state["sub_callgraph"] = self._callgraph_subparser.mp_result()
+        # the merge inspects the subgraph edges, they must all be in the graph
+        assert not self._provenance._pending_edges,\
+            "Provenance edges pending after the worker result"
         return state
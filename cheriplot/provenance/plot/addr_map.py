@@ -34,11 +34,12 @@ from operator import itemgetter
 
 from sortedcontainers import SortedDict
 
-from matplotlib.collections import LineCollection, PatchCollection, PathCollection
+from matplotlib.collections import (
+    LineCollection, PathCollection, PolyCollection)
 from matplotlib.colors import colorConverter
 from matplotlib.font_manager import FontProperties
 from matplotlib.markers import MarkerStyle
-from matplotlib.patches import Patch, Rectangle, PathPatch
+from matplotlib.patches import Patch, PathPatch
 from matplotlib.text import Text
 from matplotlib.transforms import Bbox, blended_transform_factory
 
@@ -112,8 +113,22 @@ class BaseColorCodePatchBuilder(ASAxesPatchBuilder, PickablePatchBuilder):
             self._bbox[3] = y
 
     def _get_patch_collections(self, axes):
-        """Return a generator of collections of patches to add to the axes."""
-        pass
+        """
+        Return a generator of collections of patches to add to the axes.
+
+        The segments are accumulated in plain lists during the inspection
+        and are stacked in a single (N, 2, 2) array here.
+        The collections are rasterized when saved to a vector format,
+        a vector path for each of the capabilities makes the output
+        file huge and slow to render.
+        """
+        for key, collection in self._collection_map.items():
+            segments = np.asarray(collection, dtype=float).reshape(-1, 2, 2)
+            coll = LineCollection(segments,
+                                  colors=[self._colors[key]],
+                                  linestyle="solid",
+                                  rasterized=True)
+            yield coll
 
     def get_patches(self, axes):
         """
@@ -181,6 +196,11 @@ class ColorCodePatchBuilder(BaseColorCodePatchBuilder):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        self._rwx_mask = (CheriCapPerm.LOAD |
+                          CheriCapPerm.STORE |
+                          CheriCapPerm.EXEC)
+        """Permission bits used to select the color of a node."""
+
         # permission composition shorthands
         load_store = CheriCapPerm.LOAD | CheriCapPerm.STORE
         load_exec = CheriCapPerm.LOAD | CheriCapPerm.EXEC
@@ -203,25 +223,20 @@ class ColorCodePatchBuilder(BaseColorCodePatchBuilder):
     def inspect(self, vertex):
         """Inspect a graph vertex and create the patches for it."""
         data = self._pgm.data[vertex]
-        self._add_bbox(data.cap.base, data.cap.bound, data.cap.t_alloc)
-
-        coords = ((data.cap.base, data.cap.t_alloc),
-                  (data.cap.bound, data.cap.t_alloc))
-        perms = data.cap.permissions or 0
-        rwx_perm = perms & (CheriCapPerm.LOAD |
-                            CheriCapPerm.STORE |
-                            CheriCapPerm.EXEC)
-        self._collection_map[rwx_perm].append(coords)
+        # compute the node geometry once, the bound is a derived property
+        cap = data.cap
+        base = cap.base
+        bound = cap.bound
+        y = cap.t_alloc
+        self._add_bbox(base, bound, y)
+
+        perms = cap.permissions or 0
+        rwx_perm = perms & self._rwx_mask
+        self._collection_map[rwx_perm].append(((base, y), (bound, y)))
         # mark this address range as interesting
-        self._add_range(data.cap.base, data.cap.bound)
-        self._clickable_element(vertex, data.cap.t_alloc)
+        self._add_range(base, bound)
+        self._clickable_element(vertex, y)
 
-    def _get_patch_collections(self, axes):
-        for key, collection in self._collection_map.items():
-            coll = LineCollection(collection,
-                                  colors=[self._colors[key]],
-                                  linestyle="solid")
-            yield coll
 
     def get_legend(self, handles):
         legend = super().get_legend(handles)
@@ -259,8 +274,12 @@ class DerefPatchBuilder(BaseColorCodePatchBuilder):
     def inspect(self, vertex):
         """Create a patch for every dereference in the node."""
         data = self._pgm.data[vertex]
-        load = data.event_tbl["type"] == EventType.DEREF_LOAD
-        store = data.event_tbl["type"] == EventType.DEREF_STORE
+        # the event table and its columns are looked up once,
+        # the selections below are reused for all the geometry
+        event_tbl = data.event_tbl
+        event_type = event_tbl["type"]
+        load = event_type == EventType.DEREF_LOAD
+        store = event_type == EventType.DEREF_STORE
         deref = load | store
         if not deref.any():
             # no dereferences, skip
@@ -269,29 +288,23 @@ class DerefPatchBuilder(BaseColorCodePatchBuilder):
         base = data.cap.base
         bound = data.cap.bound
         self._add_range(base, bound)
+        event_time = event_tbl["time"]
+        deref_time = event_time[deref]
         register_clickable = partial(self._clickable_element, vertex)
-        data.event_tbl[deref]["time"].apply(register_clickable)
+        deref_time.apply(register_clickable)
 
         # extract Y limits and set the bounding box
-        min_time = data.event_tbl[deref]["time"].min()
-        max_time = data.event_tbl[deref]["time"].max()
-        self._add_bbox(base, bound, min_time)
-        self._add_bbox(base, bound, max_time)
+        self._add_bbox(base, bound, deref_time.min())
+        self._add_bbox(base, bound, deref_time.max())
 
         # create all the line coordinates
+        load_time = event_time[load]
+        store_time = event_time[store]
         self._collection_map["load"].extend(
-            zip(zip(repeat(base), data.event_tbl[load]["time"]),
-                zip(repeat(bound), data.event_tbl[load]["time"])))
+            zip(zip(repeat(base), load_time), zip(repeat(bound), load_time)))
         self._collection_map["store"].extend(
-            zip(zip(repeat(base), data.event_tbl[store]["time"]),
-                zip(repeat(bound), data.event_tbl[store]["time"])))
+            zip(zip(repeat(base), store_time), zip(repeat(bound), store_time)))
 
-    def _get_patch_collections(self, axes):
-        for key, collection in self._collection_map.items():
-            coll = LineCollection(collection,
-                                  colors=[self._colors[key]],
-                                  linestyle="solid")
-            yield coll
 
     def get_legend(self, handles):
         handles = [
@@ -322,41 +335,68 @@ class AccessLocationPatchBuilder(BaseColorCodePatchBuilder):
     def inspect(self, vertex):
         """Create a point for every load/store in the vertex."""
         data = self._pgm.data[vertex]
-        load = data.event_tbl["type"] == EventType.LOAD
-        store = data.event_tbl["type"] == EventType.STORE
+        # the event table is looked up and filtered once,
+        # the selections below are reused for all the geometry
+        event_tbl = data.event_tbl
+        event_type = event_tbl["type"]
+        load = event_type == EventType.LOAD
+        store = event_type == EventType.STORE
         access = load | store
         if not access.any():
             # no dereferences, skip
             return
-        # make a point at the load/store location
-        self._collection_map["load"].extend(data.event_tbl[load]["addr"])
-        self._collection_map["store"].extend(data.event_tbl[store]["addr"])
+        load_tbl = event_tbl[load]
+        store_tbl = event_tbl[store]
+        access_tbl = event_tbl[access]
         # mark this address range as interesting
-        low = data.event_tbl[access]["addr"].min()
-        high = data.event_tbl[access]["addr"].max()
+        access_addr = access_tbl["addr"]
+        low = access_addr.min()
+        high = access_addr.max()
         self._add_range(low, high)
+        access_time = access_tbl["time"]
         register_clickable = partial(self._clickable_element, vertex)
-        data.event_tbl[access]["time"].apply(register_clickable)
+        access_time.apply(register_clickable)
 
         # extract Y limits and set the bounding box
-        min_time = data.event_tbl[access]["time"].min()
-        max_time = data.event_tbl[access]["time"].max()
-        self._add_bbox(low, high, min_time)
-        self._add_bbox(low, high, max_time)
+        self._add_bbox(low, high, access_time.min())
+        self._add_bbox(low, high, access_time.max())
 
-        # create all the line coordinates
-        self._collection_map["load"].extend(
-            data.event_tbl[load][["addr", "time"]])
-        self._collection_map["store"].extend(
-            data.event_tbl[store][["addr", "time"]])
+        # make a point at the load/store location, the (addr, time)
+        # points of each vertex are kept as an array
+        self._collection_map["load"].append(load_tbl[["addr", "time"]].values)
+        self._collection_map["store"].append(store_tbl[["addr", "time"]].values)
+
+    def _drop_overplotted(self, points, axes):
+        """
+        Remove the points that would be drawn on the same pixel.
+        The Y axis (time) is linear, so the time is quantized to the
+        pixel rows of the axes. The X axis scale is not linear, so points
+        are merged only if they have the same address.
+
+        :param points: (N, 2) array of (addr, time) points
+        :param axes: the axes where the points are drawn
+        :return: the points that are visible
+        """
+        ymin, ymax = self._bbox[1], self._bbox[3]
+        n_rows = max(int(np.ceil(axes.bbox.height)), 1)
+        row = np.floor((points[:, 1] - ymin) * (n_rows / max(ymax - ymin, 1)))
+        _, visible = np.unique(np.column_stack((points[:, 0], row)),
+                               axis=0, return_index=True)
+        return points[np.sort(visible)]
 
     def _get_patch_collections(self, axes):
         for key, collection in self._collection_map.items():
             marker = self._markers[key]
+            if collection:
+                points = np.concatenate(collection).astype(float)
+                points = self._drop_overplotted(points, axes)
+            else:
+                points = np.empty((0, 2))
             coll = PathCollection([marker.get_path()],
-                                  offsets=collection,
+                                  offsets=points,
                                   transOffset=axes.transAxes,
-                                  facecolors=[self._colors[key]])
+                                  facecolors=[self._colors[key]],
+                                  rasterized=True)
             yield coll
 
     def get_legend(self, handles):
@@ -379,7 +419,7 @@ class VMMapPatchBuilder(ASAxesPatchBuilder):
         super().__init__()
 
         self.patches = []
-        """List of rectangles"""
+        """List of (start, end) address ranges of the rectangles"""
 
         self.patch_colors = []
         """List of colors for the patches"""
@@ -412,12 +452,7 @@ class VMMapPatchBuilder(ASAxesPatchBuilder):
         self._legend_set = set()
 
     def inspect(self, vmentry):
-        # the patches use axes transform on the y coordinate to
-        # set the height position of the label independently of
-        # the Y scale
-        rect = Rectangle((vmentry.start, 0.01),
-                         vmentry.end - vmentry.start, 0.98)
-        self.patches.append(rect)
+        self.patches.append((vmentry.start, vmentry.end))
         self.patch_colors.append(self._colors[vmentry.perms])
         self._legend_set.add(vmentry.perms)
         self._ticks.add(vmentry.start)
@@ -440,7 +475,17 @@ class VMMapPatchBuilder(ASAxesPatchBuilder):
 
     def get_patches(self, axes):
         super().get_patches(axes)
-        coll = PatchCollection(self.patches, alpha=0.1,
+        # the rectangle vertices are built in one array for all the
+        # entries, the patches use axes transform on the y coordinate to
+        # set the height position of the label independently of
+        # the Y scale
+        ranges = np.asarray(self.patches, dtype=float).reshape(-1, 2)
+        verts = np.empty((len(ranges), 4, 2))
+        verts[:, 0::3, 0] = ranges[:, 0, None]
+        verts[:, 1:3, 0] = ranges[:, 1, None]
+        verts[:, 0:2, 1] = 0.01
+        verts[:, 2:4, 1] = 0.99
+        coll = PolyCollection(verts, alpha=0.1,
                                facecolors=self.patch_colors,
                                edgecolors="k",
                                linestyle="solid",
@@ -487,6 +532,12 @@ class BaseAddressMapPlotDriver(VMMapPlotDriver, ASAxesPlotBuilderNoTitle):
             return [0.1, 0.25, 0.85, 0.65]
         return super()._get_axes_rect()
 
+    def _get_savefig_kwargs(self):
+        kw = super()._get_savefig_kwargs()
+        # resolution of the rasterized capability collections
+        kw["dpi"] = 300
+        return kw
+
     def make_axes(self):
         """
         Set the y-axis scale to display millions of cycles instead of
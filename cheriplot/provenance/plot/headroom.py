@@ -29,7 +29,7 @@ import numpy as np
 import pandas as pd
 import logging
 
-from itertools import repeat
+from itertools import chain
 
 from matplotlib.font_manager import FontProperties
 from matplotlib.patches import Patch
@@ -77,9 +77,11 @@ class PtrHeadroom:
                  # "size": [],
                  "vindex": []}
         logger.info("Vertices %d", self._pgm.prov_view().num_vertices())        
-        for v in self._pgm.graph.vertices():
-            if not self._pgm.layer_prov[v]:
-                continue
+        # select the provenance vertices with a mask on the
+        # vertex index array instead of iterating over all the vertices
+        vertices = self._pgm.graph.get_vertices()
+        vertices = vertices[self._pgm.layer_prov.a[vertices].astype(bool)]
+        for v in vertices:
             data = self._pgm.data[v]
             access = ((data.event_tbl["type"] == EventType.DEREF_LOAD) |
                       (data.event_tbl["type"] == EventType.DEREF_STORE))
@@ -122,7 +124,7 @@ class PtrHeadroom:
             table["head"].append(headroom)
             table["tail"].append(tailroom)
             # table["size"].append(data.cap.length)
-            table["vindex"].append(self._pgm.graph.vertex_index[v])
+            table["vindex"].append(int(v))
 
         logger.info("Headroom entries %d", len(table["head"]))
         # make the hadroom data table
@@ -149,9 +151,9 @@ class PtrHeadroom:
         logger.info("histogram %s", self.histogram)
 
     def get_cvertex_at(self, time):
-        for cv in self._pgm.graph.vertices():
-            if not self._pgm.layer_call[cv]:
-                continue
+        vertices = self._pgm.graph.get_vertices()
+        vertices = vertices[self._pgm.layer_call.a[vertices].astype(bool)]
+        for cv in map(self._pgm.graph.vertex, vertices):
             # find parent and call edge
             edge = None
             for parent in cv.in_neighbours():
@@ -232,18 +234,17 @@ class HeadroomPatchBuilder(PatchBuilder):
 
     def get_patches(self, axes):
         axes.bar(self.get_xticks(), self.hr.histogram, color="b")
-        # build the size points coordinates
-        points = []
-        for bucket_x, sizes in zip(self.get_xticks(), self.hr.sizes_per_bucket):
-            coords = zip(repeat(bucket_x), sizes)
-            coord_array = np.array(list(coords))
-            if len(coord_array):
-                points.append(coord_array)
-        points = np.concatenate(points)
+        # build the size points coordinates, the sizes are accumulated in
+        # a flat list and converted once instead of stacking one array
+        # per bucket
+        counts = [len(sizes) for sizes in self.hr.sizes_per_bucket]
+        points_x = np.repeat(self.get_xticks(), counts)
+        points_y = np.fromiter(chain.from_iterable(self.hr.sizes_per_bucket),
+                               dtype=float, count=sum(counts))
         twin = axes.twinx()
         twin.set_yscale("log", basey=2)
         twin.set_ylabel("Capability size")
-        twin.scatter(points[:, 0], points[:, 1], color="r")
+        twin.scatter(points_x, points_y, color="r")
         # axes.plot([0, 2**63], [0, 2**63], color="k")
 
 
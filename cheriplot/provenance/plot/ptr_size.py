@@ -30,16 +30,15 @@ import pandas as pd
 import logging
 import os
 
+from array import array
+
 import matplotlib.colors as colors
 import matplotlib.cm as colormap
 
-from scipy import stats
-from matplotlib import pyplot as plt
 from matplotlib.patches import Patch
 from matplotlib.lines import Line2D
 from matplotlib.transforms import Bbox
 from matplotlib.font_manager import FontProperties
-from graph_tool.all import GraphView
 
 from cheriplot.core import (
     ProgressTimer, ProgressPrinter, ExternalLegendTopPlotBuilder,
@@ -47,6 +46,7 @@ from cheriplot.core import (
     Option, Argument)
 from cheriplot.provenance.visit import (
     FilterNullVertices, FilterKernelVertices, FilterCfromptr, MergeCfromptr)
+from cheriplot.provenance.model import EventType, ProvenanceVertexData
 from cheriplot.provenance.parser import CheriMipsModelParser
 from cheriplot.provenance.plot import VMMapPlotDriver
 
@@ -57,8 +57,11 @@ class CapSizeHistogram:
     Base class for the histogram data structure building strategy
     """
 
-    def __init__(self, provenance_graph, vmmap):
-        self.graph = provenance_graph
+    def __init__(self, pgm, vmmap):
+        self.pgm = pgm
+        """The graph manager"""
+
+        self.graph = pgm.prov_view()
         """The provenance graph"""
 
         self.vmmap = vmmap
@@ -76,23 +79,46 @@ class CapSizeHistogram:
         self._build_histogram()
 
     def _build_histogram(self):
-        hist_data = self._build_histogram_input()
-        for vm_entry, data in zip(self.vmmap, hist_data):
-            if len(data) == 0:
-                continue
-            # the bin size is logarithmic
-            data = np.log2(data)
-            h, b = np.histogram(data, bins=self.n_bins)
-            # append histogram to the dataframes
-            self.abs_histogram.loc[vm_entry] = h
-            self.norm_histogram.loc[vm_entry] = h / np.sum(h)
+        lengths, entry_idx = self._build_histogram_input()
+        vm_entries = list(self.vmmap)
+        n_bins = len(self.n_bins) - 1
+        # the bin size is logarithmic, the bins are computed once for
+        # all the entries and counted with a single bincount over
+        # the (entry, bin) pairs. As in np.histogram the last bin
+        # is closed and values outside the bins are not counted.
+        # The bin edges are integers so floor(log2(size)) selects the
+        # same bin as log2(size), it is the binary exponent of the size
+        # and does not need a logarithm. Zero sizes get -1 and are
+        # not counted.
+        data = np.frexp(lengths.astype(np.float64))[1] - 1
+        bin_idx = np.digitize(data, self.n_bins) - 1
+        bin_idx[data == self.n_bins[-1]] = n_bins - 1
+        in_range = (bin_idx >= 0) & (bin_idx < n_bins)
+        hist = np.bincount(
+            entry_idx[in_range] * n_bins + bin_idx[in_range],
+            minlength=len(vm_entries) * n_bins).reshape(-1, n_bins)
+        # the dataframes hold a row for each entry with data, they are
+        # built in one go, growing them row by row copies them each time
+        has_data = np.bincount(entry_idx, minlength=len(vm_entries)) > 0
+        index = [vm_entry for vm_entry, keep in zip(vm_entries, has_data)
+                 if keep]
+        hist = hist[has_data]
+        self.abs_histogram = pd.DataFrame(
+            hist, index=index, columns=self.n_bins[1:])
+        self.norm_histogram = pd.DataFrame(
+            hist / np.sum(hist, axis=1, keepdims=True),
+            index=index, columns=self.n_bins[1:])
 
     def _build_histogram_input(self):
         """
-        Build the input data structure containing a list of data to use
-        for the histogram for each entry in the vmmap entry.
+        Build the input data for the histogram of each entry in the vmmap.
+        The input is given as two flat parallel arrays, the capability
+        sizes and the index of the vmmap entry each size is counted in.
+        The same capability may occur multiple times.
+
+        :return: tuple (lengths, entry_idx) of :class:`numpy.ndarray`
         """
-        return None
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
 
 
 class CapSizeDerefHistogram(CapSizeHistogram):
@@ -108,29 +134,50 @@ class CapSizeDerefHistogram(CapSizeHistogram):
     def _build_histogram_input(self):
         # indexes in the vmmap and in the norm_histograms are
         # the same.
-        vm_entries = list(self.vmmap)
-        # hist_data = [[] for _ in range(len(vm_entries))]
-        hist_data = np.empty(len(vm_entries), dtype=object)
-        hist_data[:] = [[] for _ in range(len(vm_entries))]
+        starts, ends = self.vmmap.limits()
 
         progress = ProgressPrinter(self.graph.num_vertices(),
                                    desc="Sorting capability references")
-        # the loop checks, for each vertex in the graph, where it is
-        # dereferenced and adds the dereferenced capability size to every
-        # histogram-input-data relative to the VM map entry where the
-        # capability is dereferenced
-        limits = np.array([(e.start, e.end) for e in vm_entries])
-        for node in self.graph.vertices():
-            data = self.graph.vp.data[node]
-            addr = np.array(data.deref["addr"])
-            hist_idx = map(
-                lambda lim: np.logical_and(addr >= lim[0], addr <= lim[1]),
-                limits)
-            for idx, match in enumerate(hist_idx):
-                hist_data[idx].extend([data.cap.length] * len(addr[match]))
+        # gather the events of all the vertices in flat arrays, the
+        # ragged per-vertex event columns are appended at C level and
+        # the size of each capability is repeated for the number of
+        # events of its vertex, so that the dereferences and the VM map
+        # entries are matched with vectorized operations instead of
+        # a comparison for each vertex.
+        event_typecodes = ProvenanceVertexData._event_typecodes
+        event_dtypes = ProvenanceVertexData._event_dtypes
+        vertices = self.graph.get_vertices()
+        vertex_lengths = self.pgm.vertex_arrays(self.graph)["length"][vertices]
+        event_counts = np.empty(len(vertices), dtype=np.int64)
+        addrs = array(event_typecodes["addr"])
+        types = array(event_typecodes["type"])
+        vertex_data = self.pgm.data
+        for idx, node in enumerate(vertices):
+            events = vertex_data[node].events
+            addrs.extend(events["addr"])
+            types.extend(events["type"])
+            event_counts[idx] = len(events["type"])
             progress.advance()
         progress.finish()
-        return hist_data
+        addrs = np.array(addrs, dtype=event_dtypes["addr"])
+        types = np.array(types, dtype=event_dtypes["type"])
+        lengths = np.repeat(vertex_lengths, event_counts)
+        is_deref = (types & int(EventType.deref_mask())) != 0
+        addrs = addrs[is_deref]
+        lengths = lengths[is_deref]
+        # the dereferenced capability size is added to the
+        # histogram-input-data relative to the VM map entry where the
+        # capability is dereferenced. The VM map entries do not overlap,
+        # so the entry holding each address is found with a binary search
+        # on the sorted entry start addresses.
+        order = np.argsort(starts, kind="stable")
+        pos = np.searchsorted(starts[order], addrs, side="right") - 1
+        found = pos >= 0
+        entry_idx = order[pos[found]]
+        addrs = addrs[found]
+        lengths = lengths[found]
+        found = addrs <= ends[entry_idx]
+        return lengths[found], entry_idx[found]
 
 
 class CapSizeBoundHistogram(CapSizeHistogram):
@@ -147,25 +194,20 @@ class CapSizeBoundHistogram(CapSizeHistogram):
     def _build_histogram_input(self):
         # indexes in the vmmap and in the norm_histograms are
         # the same.
-        vm_entries = list(self.vmmap)
-        hist_data = np.empty(len(vm_entries), dtype=object)
-        hist_data[:] = [[] for _ in range(len(vm_entries))]
-        progress = ProgressPrinter(self.graph.num_vertices(),
-                                   desc="Sorting capability references")
-        # the loop checks, for each vertex in the graph, whether the
-        # capability can be dereferenced in a VM map entry,
-        # if so it adds the capability size to the histogram-input-data
-        # relative to the VM map entry.
-        limits = np.array([(e.start, e.end) for e in vm_entries])
-        for node in self.graph.vertices():
-            data = self.graph.vp.data[node]
-            match = np.logical_and(data.cap.base <= limits[:,1],
-                                   data.cap.bound >= limits[:,0])
-            for in_data in hist_data[match]:
-                in_data.append(data.cap.length)
-            progress.advance()
-        progress.finish()
-        return hist_data
+        # the capability fields are extracted once in flat arrays,
+        # then for each vertex and VM map entry the check of whether the
+        # capability can be dereferenced in the entry is done with a
+        # single vectorized comparison. The capability size is added to
+        # the histogram-input-data relative to every matching entry.
+        vertices = self.graph.get_vertices()
+        arrays = self.pgm.vertex_arrays(self.graph)
+        bases = arrays["base"][vertices]
+        lengths = arrays["length"][vertices]
+        bounds = bases + lengths
+        starts, ends = self.vmmap.limits()
+        match = (bases[:, None] <= ends) & (bounds[:, None] >= starts)
+        vertex_idx, entry_idx = np.nonzero(match)
+        return lengths[vertex_idx], entry_idx
 
 
 class HistogramPatchBuilder(PatchBuilder):
@@ -192,8 +234,9 @@ class HistogramPatchBuilder(PatchBuilder):
         assert self.hist == None, \
             "This patch builder can process only a single histogram"
         self.hist = hist
-        self.colormap = [plt.cm.Dark2(i) for i in
-                         np.linspace(0, 0.9, len(hist.n_bins))]
+        # map all the bin colors in a single colormap call
+        self.colormap = [tuple(c) for c in colormap.Dark2(
+            np.linspace(0, 0.9, len(hist.n_bins)))]
 
     def _get_positions(self):
         """X locations of the histogram bars."""
@@ -247,20 +290,24 @@ class HistogramPatchBuilder(PatchBuilder):
             mgr.set_limits(0, np.inf)
             self.label_managers.append(mgr)
         # build the bars in the plot
+        bar_width = 0.8
+        # the absolute count is written at the left of each bar,
+        # the label positions are computed for a whole row of bars
+        # from the bar geometry instead of querying each bar patch
+        text_x = np.asarray(positions) - bar_width
         bottom = np.zeros(norm_hist.shape[0])
         for bin_idx, bin_limit in enumerate(norm_hist.columns):
             color = self.colormap[bin_idx]
-            bar_slices = axes.bar(positions, norm_hist[bin_limit],
-                                     bottom=bottom, color=color)
-            bottom = bottom + norm_hist[bin_limit]
+            heights = norm_hist[bin_limit].values
+            axes.bar(positions, heights, width=bar_width,
+                     bottom=bottom, color=color)
+            text_y = bottom + heights / 2
+            bottom = bottom + heights
             # create text labels
-            for bar_idx,hist_idx in enumerate(norm_hist.index):
-                bar = bar_slices[bar_idx]
-                abs_bin = abs_hist.at[hist_idx, bin_limit]
-                # write the absolute count count at the left of each bar
-                text_x = bar.get_x() - bar.get_width() / 2
-                text_y = bar.get_y() + bar.get_height() / 2
-                txt = AutoText(text_x, text_y, " %d " % abs_bin,
+            abs_bins = abs_hist[bin_limit].values
+            for bar_idx in range(norm_hist.shape[0]):
+                txt = AutoText(text_x[bar_idx], text_y[bar_idx],
+                               " %d " % abs_bins[bar_idx],
                                ha="center", va="center",
                                rotation="horizontal",
                                label_manager=self.label_managers[bar_idx])
@@ -278,7 +325,7 @@ class PtrSizePlotDriver(VMMapPlotDriver, ExternalLegendTopPlotBuilder):
 
     def run(self):
         pgm = self._pgm_list[0]
-        hist = self.histogram_builder_class(pgm.prov_view(), self._vmmap)
+        hist = self.histogram_builder_class(pgm, self._vmmap)
         self.register_patch_builder([hist], HistogramPatchBuilder(self.fig))
         self.process(out_file=self.config.outfile)
 
@@ -339,46 +386,59 @@ class PtrBoundCdf:
                     force_bound=None):
         self.pretend_maps.append((mask, invalid_value, force_base, force_bound))
 
-    def _check_ignore(self, v):
+    def _vertex_sizes(self):
         """
-        Check if a vertex base and bound should be ignored and set to
-        something else.
-        Return the new base and length, or None
+        Return the array of capability sizes of the vertices in the graph,
+        taking into account the pretend maps.
+        The pretend maps are applied in order, the first map that matches
+        a vertex determines its size.
         """
+        vertices = self.graph.get_vertices()
+        ptr_sizes = self.pgm.vertex_arrays(self.graph)["length"][vertices]
+        if not self.pretend_maps:
+            return ptr_sizes
+        ignored = np.zeros(len(vertices), dtype=bool)
+        target_arrays = None
         for ignore_mask, invalid, base, bound in self.pretend_maps:
-            if ignore_mask[v] != invalid:
-                self.num_ignored += 1
-                if base is None or bound is None:
-                    u = self.pgm.graph.vertex(ignore_mask[v])
-                    u_data = self.pgm.data[u]
-                    return u_data.cap.base, u_data.cap.bound
-                else:
-                    return base, bound
-        return None
+            mask_values = ignore_mask.a[vertices]
+            match = (mask_values != invalid) & ~ignored
+            if base is None or bound is None:
+                # the mask holds the vertex to take the size from
+                if target_arrays is None:
+                    target_arrays = self.pgm.vertex_arrays()
+                targets = mask_values[match].astype(np.int64)
+                ptr_sizes[match] = target_arrays["length"][targets]
+            else:
+                ptr_sizes[match] = bound - base
+            ignored |= match
+        self.num_ignored += int(np.count_nonzero(ignored))
+        return ptr_sizes
 
     def build_cdf(self):
-        ptr_sizes = []
         with ProgressTimer("Build CDF"):
-            for v in self.graph.vertices():
-                vdata = self.graph.vp.data[v]
-                effective_bounds = self._check_ignore(v)
-                if effective_bounds is None:
-                    size = vdata.cap.length
-                else:
-                    size = effective_bounds[1] - effective_bounds[0]
-                ptr_sizes.append(size)
-            size_freq = stats.itemfreq(ptr_sizes)
-            #logger.debug(size_freq)
-            if not self.absolute:
-                size_pdf = size_freq[:,1] / len(ptr_sizes)
-            else:
-                size_pdf = size_freq[:,1]
-            if len(size_freq):
-                y = np.concatenate(([0, 0], np.cumsum(size_pdf)))
-                x = np.concatenate(([0, size_freq[0,0]], size_freq[:,0]))
-                self.size_cdf = np.column_stack((x,y))
-            else:
-                self.size_cdf = np.zeros((1,2))
+            self.build_cdf_from_sizes(self._vertex_sizes())
+
+    def build_cdf_from_sizes(self, ptr_sizes):
+        """
+        Build the CDF from precomputed capability sizes.
+
+        :param ptr_sizes: array of capability sizes, one for each vertex
+        """
+        sizes, size_count = np.unique(ptr_sizes, return_counts=True)
+        if not self.absolute:
+            size_pdf = size_count / len(ptr_sizes)
+        else:
+            size_pdf = size_count
+        if len(sizes):
+            # the CDF steps are written in place in the result array
+            size_cdf = np.empty((len(sizes) + 2, 2), dtype=np.float64)
+            size_cdf[0] = (0, 0)
+            size_cdf[1] = (sizes[0], 0)
+            size_cdf[2:,0] = sizes
+            np.cumsum(size_pdf, out=size_cdf[2:,1])
+            self.size_cdf = size_cdf
+        else:
+            self.size_cdf = np.zeros((1,2))
 
 
 class BaselineCdf:
@@ -389,11 +449,15 @@ class BaselineCdf:
     MAX_ADDR = 0xffffffffffffffff
     MAX_UADDR = 0x10000000000
 
+    _size_cdf = np.array([
+        [0, 0], [MAX_UADDR, 0],
+        [MAX_UADDR, 1], [MAX_ADDR, 1]])
+    """The baseline is constant, all instances share the same read-only CDF."""
+    _size_cdf.setflags(write=False)
+
     def __init__(self):
         self.name = "baseline"
-        self.size_cdf = np.array([
-            [0, 0], [self.MAX_UADDR, 0],
-            [self.MAX_UADDR, 1], [self.MAX_ADDR, 1]])
+        self.size_cdf = self._size_cdf
         self.num_ignored = -1
 
 
@@ -428,12 +492,12 @@ class CdfPatchBuilder(PatchBuilder):
         self._bbox.y1 = max(self._bbox.ymax, max(cdf.size_cdf[:,1]))
 
     def get_patches(self, axes):
-        c_map = plt.get_cmap("tab20")
+        c_map = colormap.get_cmap("tab20")
         c_norm = colors.Normalize(vmin=0, vmax=len(self.cdf))
-        scalar_map = colormap.ScalarMappable(norm=c_norm, cmap=c_map)
-        for idx, cdf in enumerate(self.cdf):
-            color = scalar_map.to_rgba(idx)
-            self.colors.append(color)
+        # map all the line colors at once
+        self.colors = [tuple(c) for c in
+                       c_map(c_norm(np.arange(len(self.cdf))))]
+        for cdf, color in zip(self.cdf, self.colors):
             axes.plot(cdf.size_cdf[:,0], cdf.size_cdf[:,1], color=color, lw=2.0)
 
     def get_legend(self, handles):
@@ -525,16 +589,27 @@ class PtrSizeCdfDriver(TaskDriver, ExternalLegendTopPlotBuilder):
         super().make_plot()
         self.ax.set_xscale("log", basex=2)
 
-    def _make_cdf_dataset(self, pgm, vfilt, setname):
-        if vfilt is not None:
-            view = GraphView(pgm.graph, vfilt=vfilt)
-            cdf = PtrBoundCdf(pgm, self.config.absolute, graph=view)
-        else:
-            cdf = PtrBoundCdf(pgm, self.config.absolute)
+    def _make_cdf_dataset(self, pgm, arrays, vmask, setname):
+        """
+        Build the CDF of a subset of the provenance vertices.
+        The vertex data is extracted once for each graph and shared
+        by all the datasets, the subset is selected by masking.
+
+        :param pgm: the graph manager
+        :param arrays: vertex arrays of the graph, see
+        :meth:`ProvenanceGraphManager.vertex_arrays`
+        :param vmask: vertex filter array, None for all the vertices
+        :param setname: name of the dataset
+        """
+        cdf = PtrBoundCdf(pgm, self.config.absolute)
         cdf.num_ignored = -1
         cdf.name = setname
         cdf.slice_name = None
-        cdf.build_cdf()
+        mask = arrays["layer_prov"]
+        if vmask is not None:
+            mask = mask & vmask.astype(bool)
+        with ProgressTimer("Build CDF"):
+            cdf.build_cdf_from_sizes(arrays["length"][mask])
         self.datasets.append(cdf)
 
     def _get_legend_kwargs(self):
@@ -552,42 +627,41 @@ class PtrSizeCdfDriver(TaskDriver, ExternalLegendTopPlotBuilder):
 
     def run(self):
         for idx, pgm in enumerate(self.pgm_list):
-            self._make_cdf_dataset(pgm, None, "all")
+            arrays = pgm.vertex_arrays()
+            self._make_cdf_dataset(pgm, arrays, None, "all")
 
             for split_set in self.config.split:
                 if split_set == "stack":
-                    self._make_cdf_dataset(pgm, pgm.graph.vp.annotated_usr_stack,
+                    self._make_cdf_dataset(pgm, arrays, pgm.graph.vp.annotated_usr_stack.a,
                                            split_set)
                 elif split_set == "stack-all":
-                    self._make_cdf_dataset(pgm, pgm.graph.vp.annotated_usr_stack,
+                    self._make_cdf_dataset(pgm, arrays, pgm.graph.vp.annotated_usr_stack.a,
                                            "stack")
-                    self._make_cdf_dataset(pgm, pgm.graph.vp.annotated_stack,
+                    self._make_cdf_dataset(pgm, arrays, pgm.graph.vp.annotated_stack.a,
                                            "stack-deref")
                 elif split_set == "malloc":
-                    self._make_cdf_dataset(pgm, pgm.graph.vp.annotated_malloc,
+                    self._make_cdf_dataset(pgm, arrays, pgm.graph.vp.annotated_malloc.a,
                                            split_set)
                 elif split_set == "exec":
-                    self._make_cdf_dataset(pgm, pgm.graph.vp.annotated_exec,
+                    self._make_cdf_dataset(pgm, arrays, pgm.graph.vp.annotated_exec.a,
                                            split_set)
                 elif split_set == "caprelocs":
-                    self._make_cdf_dataset(pgm, pgm.graph.vp.annotated_capreloc,
+                    self._make_cdf_dataset(pgm, arrays, pgm.graph.vp.annotated_capreloc.a,
                                            "relocs")
                 elif split_set == "caprelocs-only":
-                    difference = pgm.graph.new_vertex_property("bool")
-                    difference.a = (pgm.graph.vp.annotated_capreloc.a &
-                                    ~pgm.graph.vp.annotated_globptr.a)                    
-                    self._make_cdf_dataset(pgm, difference, "relocs-only")
+                    difference = (pgm.graph.vp.annotated_capreloc.a &
+                                  ~pgm.graph.vp.annotated_globptr.a)
+                    self._make_cdf_dataset(pgm, arrays, difference, "relocs-only")
                 elif split_set == "glob":
                     # any global pointers or pointers derived from global pointers
-                    combined = pgm.graph.new_vertex_property("bool")
-                    combined.a = (pgm.graph.vp.annotated_globptr.a |
-                                  pgm.graph.vp.annotated_globderived.a)
-                    self._make_cdf_dataset(pgm, combined, split_set)
-                    self._make_cdf_dataset(pgm, pgm.graph.vp.annotated_captblptr, "captbl")
+                    combined = (pgm.graph.vp.annotated_globptr.a |
+                                pgm.graph.vp.annotated_globderived.a)
+                    self._make_cdf_dataset(pgm, arrays, combined, split_set)
+                    self._make_cdf_dataset(pgm, arrays, pgm.graph.vp.annotated_captblptr.a, "captbl")
                 elif split_set == "kern":
                     # kernel originated and syscall originated vertices
-                    self._make_cdf_dataset(pgm, pgm.graph.vp.annotated_ksyscall, "syscall")
-                    self._make_cdf_dataset(pgm, pgm.graph.vp.annotated_korigin, "kern")
+                    self._make_cdf_dataset(pgm, arrays, pgm.graph.vp.annotated_ksyscall.a, "syscall")
+                    self._make_cdf_dataset(pgm, arrays, pgm.graph.vp.annotated_korigin.a, "kern")
                 else:
                     logger.error("Invalid --split option value %s", split_set)
                     raise ValueError("Invalid --split option value")
@@ -3,7 +3,7 @@ This module implements the various algorithms that walk the graph to filter, upd
 """
 from .base import (
     GraphVisitBase, ChainGraphVisit, BFSGraphVisit, DFSGraphVisit,
-    MaskBFSVisit, MaskDFSVisit, DecorateBFSVisit)
+    MaskBFSVisit, MaskDFSVisit, VectorMaskVisit, DecorateBFSVisit)
 from .vertex_merge import MergeCfromptr
 from .filters import *
 
@@ -30,6 +30,7 @@ Base classes and functions for cheriplot graph visit.
 
 import logging
 
+import numpy as np
 from graph_tool.all import (
     GraphView, BFSVisitor, bfs_search, DFSVisitor, dfs_search)
 
@@ -37,6 +38,22 @@ from cheriplot.core import ProgressTimer, ProgressManager
 
 logger = logging.getLogger(__name__)
 
+def _evaluate_mask(expr, variables):
+    """
+    Evaluate a vertex mask expression over the vertex arrays.
+    numexpr is optional, when it is not installed the expression
+    is evaluated with numpy operators.
+
+    :param expr: the mask expression
+    :param variables: dict of arrays and constants used in the expression
+    :return: boolean array
+    """
+    try:
+        import numexpr
+    except ImportError:
+        return eval(expr, {"__builtins__": {}}, variables)
+    return numexpr.evaluate(expr, local_dict=variables)
+
 class GraphVisitBase:
     """
     Base class for graph visiting classes.
@@ -55,6 +72,12 @@ class GraphVisitBase:
     order = None
     description = ""
 
+    modifies_vertex_data = False
+    """
+    The visit changes the data of the provenance vertices, the cached
+    vertex arrays of the graph manager are dropped after the visit.
+    """
+
     def __init__(self, pgm):
         """
         Base constructor for a graph visit.
@@ -96,15 +119,19 @@ class GraphVisitBase:
         :return: a :class:`graph_tool.GraphView` after the scan.
         """
         msg = "{}".format(self)
-        with ProgressTimer(msg, logger):
-            progress_range = self._get_progress_range(graph_view)
-            if progress_range:
-                start, end = progress_range
-                with ProgressManager(msg, start, end) as progress:
-                    self.progress = progress
+        try:
+            with ProgressTimer(msg, logger):
+                progress_range = self._get_progress_range(graph_view)
+                if progress_range:
+                    start, end = progress_range
+                    with ProgressManager(msg, start, end) as progress:
+                        self.progress = progress
+                        return self._do_visit(graph_view)
+                else:
                     return self._do_visit(graph_view)
-            else:
-                return self._do_visit(graph_view)
+        finally:
+            if self.modifies_vertex_data:
+                self.pgm.invalidate_vertex_arrays()
 
     def finalize(self, graph_view):
         """
@@ -156,9 +183,32 @@ class ChainGraphVisit(GraphVisitBase):
         return self
 
     def __call__(self, graph_view):
+        # consecutive vector masks are evaluated together so that the
+        # vertex arrays are extracted once and the masks are fused
+        # in a single expression
+        vector_masks = []
         for visitor in self._visitors:
+            if isinstance(visitor, VectorMaskVisit):
+                vector_masks.append(visitor)
+                continue
+            graph_view = self._visit_vector_masks(vector_masks, graph_view)
+            vector_masks = []
             graph_view = visitor(graph_view)
-        return graph_view
+        return self._visit_vector_masks(vector_masks, graph_view)
+
+    def _visit_vector_masks(self, visitors, graph_view):
+        """
+        Apply a sequence of :class:`VectorMaskVisit` to the graph view.
+
+        :param visitors: list of vector mask visits
+        :param graph_view: a :class:`graph_tool.GraphView`
+        :return: a :class:`graph_tool.GraphView` after the scan.
+        """
+        if not visitors:
+            return graph_view
+        if len(visitors) == 1:
+            return visitors[0](graph_view)
+        return VectorMaskVisit.combine(self.pgm, visitors)(graph_view)
 
 
 class BFSGraphVisit(BFSVisitor, GraphVisitBase):
@@ -203,6 +253,89 @@ class MaskDFSVisit(DFSGraphVisit):
         return GraphView(graph_view, vfilt=self.vertex_mask)
 
 
+class VectorMaskVisit(GraphVisitBase):
+    """
+    Base class for visits that generate a masked graph-view from
+    a predicate on the capability fields of the provenance vertices.
+
+    The vertex data is extracted once in the arrays returned by
+    :meth:`ProvenanceGraphManager.vertex_arrays` and the mask is
+    computed in a single vectorized pass instead of a callback per vertex.
+    """
+
+    order = "vector"
+
+    mask_expr = None
+    """
+    Expression over the vertex arrays that is True for the
+    vertices to mask, e.g. "origin == FROMPTR".
+    This is evaluated by numexpr or by numpy, so only the bitwise
+    and comparison operators are allowed and the comparisons
+    must be enclosed in parentheses.
+    """
+
+    mask_constants = {}
+    """Named constants that can be used in :attr:`mask_expr`."""
+
+    def __init__(self, pgm):
+        super().__init__(pgm)
+
+        self.vertex_mask = self.pgm.graph.new_vertex_property("bool", val=True)
+        """Vertex filter property"""
+
+    @classmethod
+    def combine(cls, pgm, visitors):
+        """
+        Build a visit that masks all the vertices masked by any
+        of the given visits.
+        Masking filters commute, so the result is the same as applying
+        the visits in sequence.
+
+        :param pgm: graph model manager
+        :param visitors: iterable of :class:`VectorMaskVisit`
+        :return: a :class:`VectorMaskVisit`
+        """
+        combined = cls(pgm)
+        combined.mask_expr = " | ".join(
+            "({})".format(visitor.mask_expr) for visitor in visitors)
+        combined.mask_constants = {}
+        for visitor in visitors:
+            combined.mask_constants.update(visitor.mask_constants)
+        combined.description = " + ".join(
+            visitor.__class__.__name__ for visitor in visitors)
+        return combined
+
+    def _get_progress_range(self, graph_view):
+        return None
+
+    def _mask_vertices(self, arrays):
+        """
+        Compute the vertices to mask.
+        The expression is evaluated by numexpr when available so that all
+        the comparisons are fused in one pass without temporary arrays.
+
+        :param arrays: dict of vertex field arrays, see
+        :meth:`ProvenanceGraphManager.vertex_arrays`
+        :return: boolean array, True for the vertices that are masked
+        """
+        variables = dict(self.mask_constants)
+        for name, values in arrays.items():
+            # numexpr does not support unsigned 64-bit integers
+            if values.dtype == np.uint64:
+                values = values.view(np.int64)
+            variables[name] = values
+        return _evaluate_mask("layer_prov & ({})".format(self.mask_expr),
+                              variables)
+
+    def _do_visit(self, graph_view):
+        arrays = self.pgm.vertex_arrays(graph_view)
+        self.vertex_mask.a[self._mask_vertices(arrays)] = False
+        return self.finalize(graph_view)
+
+    def finalize(self, graph_view):
+        return GraphView(graph_view, vfilt=self.vertex_mask)
+
+
 class DecorateBFSVisit(BFSGraphVisit):
     """
     Base class for visits that generate a new graph mask property
@@ -37,7 +37,8 @@ from cached_property import cached_property
 from sortedcontainers import SortedDict
 from elftools.elf.elffile import ELFFile
 
-from cheriplot.provenance.visit import MaskBFSVisit, DecorateBFSVisit, BFSGraphVisit
+from cheriplot.provenance.visit import (
+    MaskBFSVisit, VectorMaskVisit, DecorateBFSVisit, BFSGraphVisit)
 from cheriplot.provenance.model import CheriNodeOrigin, EdgeOperation, ProvenanceVertexData, CheriCapPerm, EventType
 
 logger = logging.getLogger(__name__)
@@ -140,20 +141,16 @@ class FilterBeforeExecve(MaskBFSVisit):
                 self.vertex_mask[v] = False
 
 
-class FilterNullVertices(MaskBFSVisit):
+class FilterNullVertices(VectorMaskVisit):
     """
     Generate a graph_view that masks all NULL capabilities.
     """
 
     description = "Mask NULL capabilities"
 
-    def examine_vertex(self, u):
-        self.progress.advance()
-        if self.pgm.layer_prov[u]:
-            data = self.pgm.data[u]
-            if ((data.cap.length == 0 and data.cap.base == 0) or
-                not data.cap.valid):
-                self.vertex_mask[u] = False
+    # a None base or length is not a NULL capability field
+    mask_expr = ("((length == 0) & has_length & (base == 0) & has_base) | "
+                 "~valid")
 
 
 class DecorateKernelCapabilities(DecorateBFSVisit):
@@ -537,14 +534,23 @@ class DetectStackCapability(BFSGraphVisit):
         pgm.graph.gp["stack_vertex"] = stack_vertex
 
     def check_parent(self, v):
-        for e in v.in_edges():
-            parent = e.source()
-            if self.pgm.layer_prov[parent]:
-                if int(parent) == self.pgm.graph.gp.stack_vertex:
-                    return True
-                else:
-                    return self.check_parent(parent)
-        return False
+        """
+        Check whether the stack vertex is an ancestor of the given vertex.
+        The provenance chain is walked with a loop, deep chains would
+        otherwise exceed the recursion limit.
+        """
+        layer_prov = self.pgm.layer_prov
+        stack_vertex = self.pgm.graph.gp.stack_vertex
+        while True:
+            for e in v.in_edges():
+                parent = e.source()
+                if layer_prov[parent]:
+                    break
+            else:
+                return False
+            if int(parent) == stack_vertex:
+                return True
+            v = parent
 
     def is_stack_root(self, v):
         """
@@ -690,22 +696,18 @@ class FilterStackVertices(MaskBFSVisit):
             self.vertex_mask[u] = False
 
 
-class FilterKernelVertices(MaskBFSVisit):
+class FilterKernelVertices(VectorMaskVisit):
     """
     Generate a graph_view that masks all kernel vertices and NULL capabilities.
     """
 
     description = "Mask Kernel capabilities"
 
-    def examine_vertex(self, u):
-        self.progress.advance()
-        if self.pgm.layer_prov[u]:
-            data = self.pgm.data[u]
-            if data.pc != 0 and data.is_kernel:
-                self.vertex_mask[u] = False
+    # a None pc is not 0, the vertex is masked
+    mask_expr = "((pc != 0) | ~has_pc) & is_kernel"
 
 
-class FilterCfromptr(MaskBFSVisit):
+class FilterCfromptr(VectorMaskVisit):
     """
     Transform that removes cfromptr vertices that are never stored
     in memory nor used for dereferencing.
@@ -713,23 +715,11 @@ class FilterCfromptr(MaskBFSVisit):
 
     description = "Filter temporary cfromptr"
 
-    def examine_vertex(self, u):
-        self.progress.advance()
-        if not self.pgm.layer_prov[u]:
-            return
-        data = self.pgm.data[u]
-        if data.origin == CheriNodeOrigin.FROMPTR:
-            self.vertex_mask[u] = False
-            # if (data.origin == CheriNodeOrigin.FROMPTR and
-            #     len(data.address) == 0 and
-            #     len(data.deref["load"]) == 0 and
-            #     len(data.deref["load"]) == 0):
-            #     # remove cfromptr that are never stored or used in
-            #     # a dereference
-            #     self.vertex_mask[u] = True
+    mask_expr = "origin == FROMPTR"
+    mask_constants = {"FROMPTR": int(CheriNodeOrigin.FROMPTR)}
 
 
-class FilterCandperm(MaskBFSVisit):
+class FilterCandperm(VectorMaskVisit):
     """
     Transform that removes cfromptr vertices that are never stored
     in memory nor used for dereferencing.
@@ -737,30 +727,20 @@ class FilterCandperm(MaskBFSVisit):
 
     description = "Filter candperm derived vertices"
 
-    def examine_vertex(self, u):
-        self.progress.advance()
-        if not self.pgm.layer_prov[u]:
-            return
-        data = self.pgm.data[u]
-        if data.origin == CheriNodeOrigin.ANDPERM:
-            self.vertex_mask[u] = False
+    mask_expr = "origin == ANDPERM"
+    mask_constants = {"ANDPERM": int(CheriNodeOrigin.ANDPERM)}
 
 
-class FilterRootVertices(MaskBFSVisit):
+class FilterRootVertices(VectorMaskVisit):
     """
     Transform that removes root vertices.
     """
 
     description = "Filter root vertices"
 
-    def examine_vertex(self, u):
-        self.progress.advance()
-        if not self.pgm.layer_prov[u]:
-            return
-        data = self.pgm.data[u]
-        if (data.origin == CheriNodeOrigin.ROOT or
-            data.origin == CheriNodeOrigin.INITIAL_ROOT):
-            self.vertex_mask[u] = False
+    mask_expr = "(origin == ROOT) | (origin == INITIAL_ROOT)"
+    mask_constants = {"ROOT": int(CheriNodeOrigin.ROOT),
+                      "INITIAL_ROOT": int(CheriNodeOrigin.INITIAL_ROOT)}
 
 
 class DecorateHeap(DecorateBFSVisit):
@@ -49,6 +49,7 @@ class MergeCfromptr(MaskBFSVisit):
     """
 
     description = "Merge cfromptr+csetbounds sequences"
+    modifies_vertex_data = True
 
     def _make_merged(self, p, u):
         """
@@ -70,9 +71,9 @@ class MergeCfromptr(MaskBFSVisit):
             v_data.cap.t_free = max(u_data.cap.t_free, p_data.cap.t_free)
         else:
             v_data.cap.t_free = -1
-        for col in v_data.events.keys():
-            # XXX can I use a generator here to avoid creating the list?
-            v_data.events[col] = p_data.events[col] + u_data.events[col]
+        for col, v_events in v_data.events.items():
+            v_events.extend(p_data.events[col])
+            v_events.extend(u_data.events[col])
         # join active memory references
         delta = len(p_data.events["time"])
         u_mem = ((k, idx + delta) for k, idx in u_data.active_memory.items())
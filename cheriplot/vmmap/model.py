@@ -26,6 +26,7 @@
 #
 
 import logging
+import numpy as np
 import pandas as pd
 
 logger = logging.getLogger(__name__)
@@ -78,3 +79,18 @@ class VMMapModel:
     def __iter__(self):
         for idx, row in self.vmmap.iterrows():
             yield VMMapEntry(row)
+
+    def __len__(self):
+        return len(self.vmmap)
+
+    def limits(self):
+        """
+        Return the start and end addresses of the entries, in the same
+        order as the entries are iterated.
+        The columns are taken directly from the model dataframe, without
+        building an entry object for each row.
+
+        :return: tuple (start, end) of :class:`numpy.ndarray`
+        """
+        return (self.vmmap["start"].values.astype(np.uint64),
+                self.vmmap["end"].values.astype(np.uint64))
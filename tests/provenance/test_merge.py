@@ -830,3 +830,102 @@ def test_two_step_merge(mock_model1, mock_model2, error):
         with pytest.raises(error):
             ctx.step(worker_result_1)
             ctx.step(worker_result_2)
+
+# merge the edge data of two subgraphs
+# Test that the edges added in bulk by the merge step carry the same
+# time, addr, operation and regs as the edges of the subgraphs.
+# <call-root> -> fn -> 3 -> 4
+# arg0 -(visible)-> fn
+trace_step_1_edge_data = (
+    ("call_node", {
+        "root": True,
+        "id": "call-root",
+        "addr": None,
+    }),
+    ("call_node", {
+        "last": True,
+        "id": "fn",
+        "addr": 0xf0000,
+    }),
+    ("prov_node", {
+        "id": "arg0",
+        "origin": CheriNodeOrigin.ROOT,
+        "cap": model_cap(0x1000, 0x0, 0x100, rw_perm, t=100),
+        "pc": 0x3000
+    }),
+    ("call_edge", "call-root", "fn", {
+        "operation": EdgeOperation.CALL,
+        "time": 10,
+        "addr": 0x1000,
+    }),
+    ("call_edge", "arg0", "fn", {
+        "operation": EdgeOperation.VISIBLE,
+        "time": 10,
+        "addr": 0x50,
+        "regs": [3, 10],
+    }),
+    ("prov_edge", "partial-1", "arg0", {}),
+)
+trace_step_2_edge_data = (
+    ("call_node", {
+        "only": "subgraph",
+        "root": True,
+        "id": "step-root",
+        "addr": None,
+    }),
+    ("call_node", {
+        "id": 3,
+        "addr": 0x5000,
+    }),
+    ("call_node", {
+        "last": True,
+        "id": 4,
+        "addr": 0x6000,
+    }),
+    ("call_edge", "step-root", 3, {
+        "only": "subgraph",
+        "operation": EdgeOperation.CALL,
+        "time": 2000,
+        "addr": 0xb000,
+    }),
+    ("call_edge", "fn", 3, {
+        "only": "expect",
+        "operation": EdgeOperation.CALL,
+        "time": 2000,
+        "addr": 0xb000,
+    }),
+    ("call_edge", 3, 4, {
+        "operation": EdgeOperation.CALL,
+        "time": 2500,
+        "addr": 0xc000,
+        "regs": [4],
+    }),
+)
+
+def _edge_data(graph):
+    """Sorted data of all the edges in a graph, without the endpoints."""
+    ep = graph.ep
+    data = [(ep.time[e], ep.addr[e], ep.operation[e], list(ep.regs[e]))
+            for e in graph.edges()]
+    return sorted(data, key=repr)
+
+@pytest.mark.timeout(4)
+def test_merge_edge_data():
+    """
+    Check that the edges added in bulk by the merge steps have the
+    same data as the edges created one by one with add_edge in the
+    expected graph.
+    """
+    worker_result_1 = worker_result_base()
+    worker_result_2 = worker_result_base()
+    result = ProvenanceGraphManager("")
+    expect = ProvenanceGraphManager("")
+    builder = MockGraphBuilder(expect)
+    builder.build(worker_result_1, trace_step_1_edge_data)
+    builder.build(worker_result_2, trace_step_2_edge_data)
+
+    ctx = MergePartialSubgraphContext(result)
+    ctx.step(worker_result_1)
+    ctx.step(worker_result_2)
+    assert _edge_data(result.graph) == _edge_data(expect.graph)
+    assert_graph_equal(expect.graph, result.graph)
@@ -0,0 +1,143 @@
+"""
+Test the pickle layout of the provenance graph model
+"""
+
+import pickle
+import pytest
+
+from array import array
+
+from cheriplot.provenance.model import (
+    CheriCap, CheriCapPerm, CheriNodeOrigin, EventType,
+    ProvenanceVertexData, ProvenanceGraphManager)
+from cheriplot.provenance.visit import GraphVisitBase
+
+from tests.provenance.helper import model_cap
+
+def mk_vertex_data():
+    """Build a vertex with some events in the table."""
+    data = ProvenanceVertexData()
+    data.cap = model_cap(0x1000, 0x10, 0x100, CheriCapPerm.LOAD, t=5)
+    data.origin = CheriNodeOrigin.SETBOUNDS
+    data.pc = 0x1234
+    data.add_event(10, 0x2000, False, EventType.STORE)
+    data.add_deref(11, 0x1010, False, True, EventType.DEREF_LOAD)
+    data.add_event(12, 0x3000, True, EventType.STORE)
+    data.add_event(13, 0x3000, True, EventType.DELETE)
+    return data
+
+def assert_vertex_data_equal(data, expect):
+    assert data.cap == expect.cap
+    assert data.origin == expect.origin
+    assert data.pc == expect.pc
+    assert data.is_kernel == expect.is_kernel
+    assert data.active_memory == expect.active_memory
+    for key, typecode in ProvenanceVertexData._event_typecodes.items():
+        col = data.events[key]
+        assert isinstance(col, array)
+        assert col.typecode == typecode
+        assert list(col) == list(expect.events[key])
+
+def test_cap_pickle():
+    cap = model_cap(0x1000, 0x10, 0x100, CheriCapPerm.LOAD, otype=3, t=5)
+    cap.t_free = 20
+    result = pickle.loads(pickle.dumps(cap))
+    assert result == cap
+    assert result.t_alloc == 5
+    assert result.t_free == 20
+
+def test_cap_legacy_state():
+    """The cap dict saved before the slots may contain stale keys."""
+    cap = model_cap(0x1000, 0x10, 0x100, CheriCapPerm.LOAD)
+    state = cap.__getstate__()
+    state["removed_field"] = None
+    result = CheriCap.__new__(CheriCap)
+    result.__setstate__(state)
+    assert result == cap
+
+def test_vertex_data_pickle():
+    data = mk_vertex_data()
+    # populate the cached event table, it must not be pickled
+    assert len(data.event_tbl) == 4
+    state = data.__getstate__()
+    assert "event_tbl" not in state
+    result = pickle.loads(pickle.dumps(data))
+    assert_vertex_data_equal(result, data)
+    assert len(result.event_tbl) == 4
+    # the table is still appendable after unpickling
+    result.add_event(14, 0x4000, False, EventType.STORE)
+    assert 0x4000 in result.active_memory
+
+@pytest.mark.parametrize("mem_key", ["_active_memory", "active_memory"])
+def test_vertex_data_legacy_state(mem_key):
+    """Load the dict-of-lists layout used before the columns were packed."""
+    expect = mk_vertex_data()
+    state = {
+        "events": {key: list(col) for key, col in expect.events.items()},
+        "cap": expect.cap,
+        "origin": expect.origin,
+        "pc": expect.pc,
+        "is_kernel": expect.is_kernel,
+        mem_key: dict(expect.active_memory),
+        # stale cached table from the old pickle
+        "event_tbl": None,
+    }
+    data = ProvenanceVertexData.__new__(ProvenanceVertexData)
+    data.__setstate__(state)
+    assert_vertex_data_equal(data, expect)
+    assert "event_tbl" not in data.__dict__
+    assert len(data.event_tbl) == 4
+
+def test_graph_manager_pickle():
+    pgm = ProvenanceGraphManager("out.gt")
+    v = pgm.graph.add_vertex()
+    pgm.data[v] = mk_vertex_data()
+    pgm.layer_prov[v] = True
+    pgm.vertex_arrays()
+    result = pickle.loads(pickle.dumps(pgm))
+    assert result.outfile == "out.gt"
+    assert result.graph.num_vertices() == 1
+    assert result.layer_prov[0]
+    assert_vertex_data_equal(result.data[0], pgm.data[v])
+    arrays = result.vertex_arrays()
+    assert list(arrays["base"]) == [0x1000]
+    assert list(arrays["length"]) == [0x100]
+
+def test_shift_event_time_negative():
+    """
+    The merge shifts the events by -1 when two consecutive trace
+    blocks share a cycle value, the time of an event at 0 becomes
+    negative.
+    """
+    data = ProvenanceVertexData()
+    data.add_event(0, 0x1000, False, EventType.STORE)
+    data.add_event(5, 0x1000, False, EventType.LOAD)
+    data.shift_event_time(-1)
+    assert list(data.events["time"]) == [-1, 4]
+    result = pickle.loads(pickle.dumps(data))
+    assert list(result.events["time"]) == [-1, 4]
+    assert list(result.event_tbl["time"]) == [-1, 4]
+
+
+class ShrinkCapVisit(GraphVisitBase):
+    """Visit that edits the capability length of the vertices in place."""
+
+    modifies_vertex_data = True
+
+    def _get_progress_range(self, graph_view):
+        return None
+
+    def _do_visit(self, graph_view):
+        for v in graph_view.vertices():
+            self.pgm.data[v].cap.length = 0x10
+        return graph_view
+
+def test_vertex_arrays_visit_invalidate():
+    """Visits that edit the vertex data drop the cached vertex arrays."""
+    pgm = ProvenanceGraphManager("")
+    v = pgm.graph.add_vertex()
+    pgm.data[v] = mk_vertex_data()
+    pgm.layer_prov[v] = True
+    assert list(pgm.vertex_arrays()["length"]) == [0x100]
+    ShrinkCapVisit(pgm)(pgm.prov_view())
+    assert list(pgm.vertex_arrays()["length"]) == [0x10]
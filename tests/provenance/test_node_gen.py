@@ -557,6 +557,36 @@ trace_invalid_root_from_arith = (
     }),
 )
 
+# untagged results of cfromptr and candperm
+# The derived capabilities are untagged so no vertex is created and the
+# destination registers are cleared. The untagged $c2 has no vertex,
+# candperm does not need a parent for an untagged result.
+# The following csetbounds still derives from the start vertex.
+trace_untagged_derive = (
+    ("cfromptr $c2, $c1, $zero", {
+        "c2": pct_cap(0x0, 0x0, 0x0, 0, valid=False),
+    }),
+    ("lui $at, 0x0c", {"1": 0x08}),
+    ("candperm $c3, $c2, $at", {
+        "c3": pct_cap(0x0, 0x0, 0x0, 0, valid=False),
+    }),
+    ("lui $at, 0x100", {"1": 0x100}),
+    ("csetbounds $c2, $c1, $at", {
+        "c2": pct_cap(0x1000, 0x0, 0x100, perm),
+        "pvertex": mk_pvertex(pct_cap(0x1000, 0x0, 0x100, perm),
+                              parent="start", origin=CheriNodeOrigin.SETBOUNDS),
+    }),
+)
+
+# conditional moves from an invalid register
+# The source register was never written so the operand has no value,
+# the move does not happen and no vertex is created.
+trace_cmov_invalid_src = (
+    ("lui $at, 0x100", {"1": 0x100}),
+    ("cmovn $c1, $c3, $at", {}),
+    ("cmovz $c1, $c3, $zero", {}),
+)
+
 # attempt to create vertices with instruction with exceptions
 # generic capability arithmetic
 trace_op_exception_commit_arith = (
@@ -973,6 +1003,8 @@ trace_delay_call_after_exception = (
     (trace_cap_propagate_setoffset,),
     (trace_cap_propagate_incoffset,),
     (trace_invalid_root_from_arith,),
+    (trace_init, trace_cmov_invalid_src),
+    (trace_init, trace_untagged_derive),
     (trace_op_exception_commit_arith,),
     (trace_op_exception_commit_setbounds,),
     (trace_op_exception_commit_andperm,),
@@ -0,0 +1,84 @@
+"""
+Test the reuse of an up to date parsed graph in the parser driver
+"""
+
+import os
+import pytest
+
+from unittest import mock
+
+from cheriplot.core import run_driver_tool
+from cheriplot.provenance.model import ProvenanceGraphManager
+from cheriplot.provenance.parser.driver import GraphParserDriver
+
+@pytest.fixture
+def trace_file(tmpdir):
+    trace = tmpdir.join("trace.cvtrace")
+    trace.write("trace data")
+    return str(trace)
+
+@pytest.fixture
+def mock_parser():
+    with mock.patch("cheriplot.provenance.parser.driver."
+                    "CheriMipsModelParser") as parser:
+        yield parser
+
+def run_parse(trace, *args):
+    outfile = "{}_graph.gt".format(trace)
+    argv = [trace, "--outfile", outfile] + list(args)
+    return run_driver_tool(GraphParserDriver, argv=argv)
+
+def test_parse_skip(trace_file, mock_parser):
+    run_parse(trace_file)
+    assert mock_parser.call_count == 1
+    assert mock_parser.return_value.parse.call_count == 1
+    assert os.path.exists("{}_graph.gt.key".format(trace_file))
+    run_parse(trace_file)
+    assert mock_parser.call_count == 1
+
+def test_parse_force(trace_file, mock_parser):
+    run_parse(trace_file)
+    run_parse(trace_file, "--force")
+    assert mock_parser.call_count == 2
+    assert mock_parser.return_value.parse.call_count == 2
+
+def test_parse_options_changed(trace_file, mock_parser):
+    run_parse(trace_file)
+    run_parse(trace_file, "--cheri-cap-size", "128")
+    assert mock_parser.call_count == 2
+    run_parse(trace_file, "--cheri-cap-size", "128", "--threads", "2")
+    assert mock_parser.call_count == 3
+
+def test_parse_graph_modified(trace_file, mock_parser):
+    """
+    Other tools overwrite the graph in place, the graph must be
+    parsed again.
+    """
+    run_parse(trace_file)
+    outfile = "{}_graph.gt".format(trace_file)
+    pgm = ProvenanceGraphManager.load(outfile)
+    pgm.graph.add_vertex()
+    pgm.save()
+    stat = os.stat(outfile)
+    # make sure that the mtime changes on coarse filesystem timestamps
+    os.utime(outfile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    run_parse(trace_file)
+    assert mock_parser.call_count == 2
+
+def test_parse_skip_display_name(trace_file, mock_parser):
+    run_parse(trace_file)
+    driver = run_parse(trace_file, "--display-name", "my-graph")
+    assert mock_parser.call_count == 1
+    pgm = ProvenanceGraphManager.load(driver.pgm.outfile)
+    assert pgm.name == "my-graph"
+    # the re-saved graph is still up to date
+    run_parse(trace_file, "--display-name", "my-graph")
+    assert mock_parser.call_count == 1
+
+def test_parse_missing_trace(tmpdir, mock_parser):
+    """The missing trace is reported by the parser."""
+    mock_parser.side_effect = IOError("File not found")
+    trace = str(tmpdir.join("missing.cvtrace"))
+    with pytest.raises(IOError):
+        run_parse(trace)
+    assert mock_parser.call_count == 1
@@ -0,0 +1,130 @@
+"""
+Test the capability size histograms and CDF against a per-vertex loop
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from collections import Counter
+
+from cheriplot.vmmap.model import VMMapModel
+from cheriplot.provenance.model import (
+    CheriCapPerm, EventType, ProvenanceVertexData, ProvenanceGraphManager)
+from cheriplot.provenance.plot.ptr_size import (
+    CapSizeDerefHistogram, CapSizeBoundHistogram, PtrBoundCdf)
+
+from tests.provenance.helper import model_cap
+
+# (base, length, [dereferenced addresses])
+vertex_spec = [
+    (0x1000, 0x100, [0x1000, 0x1010, 0x8000]),
+    (0x1000, 0x0, []),
+    (0x1800, 0x800, [0x1900]),
+    (0x4000, 0x100000, [0x4000, 0x4100, 0x20000]),
+    (0x0, 0xffffffffffffffff, [0x1000, 0x30000, 0x50000]),
+    (0x20000, 0x400000, [0x20010, 0x20020]),
+    (0x60000, 0x10, [0x60000]),
+]
+
+vmmap_spec = [
+    (0x1000, 0x1fff, "rw-", "", "a.so"),
+    (0x20000, 0x2ffff, "r-x", "", "b.so"),
+    (0x4000, 0x4fff, "rw-", "", ""),
+    (0x50000, 0x5ffff, "rw-", "", "c.so"),
+]
+
+@pytest.fixture
+def ptr_size_pgm():
+    pgm = ProvenanceGraphManager("")
+    for base, length, derefs in vertex_spec:
+        data = ProvenanceVertexData()
+        data.cap = model_cap(base, 0, length, CheriCapPerm.LOAD)
+        for t, addr in enumerate(derefs):
+            data.add_deref(t, addr, False, False, EventType.DEREF_LOAD)
+        # store events are not dereferences and must not be counted
+        data.add_event(100, base, False, EventType.STORE)
+        v = pgm.graph.add_vertex()
+        pgm.data[v] = data
+        pgm.layer_prov[v] = True
+    # call layer vertex that is not part of the provenance view
+    v = pgm.graph.add_vertex()
+    pgm.layer_call[v] = True
+    return pgm
+
+@pytest.fixture
+def vmmap():
+    model = VMMapModel()
+    model.vmmap = pd.DataFrame(vmmap_spec, columns=model.vmmap.columns)
+    return model
+
+def ref_histogram(hist, vmmap, entry_sizes):
+    """
+    Build the histogram rows one entry at a time, as the original
+    per-vertex implementation did.
+    """
+    rows = []
+    for vm_entry, data in zip(vmmap, entry_sizes):
+        if len(data) == 0:
+            continue
+        h, _ = np.histogram(np.log2(np.array(data, dtype=np.float64)),
+                            bins=hist.n_bins)
+        rows.append((vm_entry.start, list(h)))
+    return rows
+
+def ref_deref_sizes(graph, vmmap):
+    entry_sizes = [[] for _ in range(len(vmmap))]
+    for v in graph.vertices():
+        data = graph.vp.data[v]
+        events = data.events
+        for addr, type_ in zip(events["addr"], events["type"]):
+            if not type_ & EventType.deref_mask():
+                continue
+            for idx, vm_entry in enumerate(vmmap):
+                if vm_entry.start <= addr <= vm_entry.end:
+                    entry_sizes[idx].append(data.cap.length)
+    return entry_sizes
+
+def ref_bound_sizes(graph, vmmap):
+    entry_sizes = [[] for _ in range(len(vmmap))]
+    for v in graph.vertices():
+        cap = graph.vp.data[v].cap
+        for idx, vm_entry in enumerate(vmmap):
+            if cap.base <= vm_entry.end and cap.bound >= vm_entry.start:
+                entry_sizes[idx].append(cap.length)
+    return entry_sizes
+
+def histogram_rows(hist):
+    return [(vm_entry.start, list(row)) for vm_entry, row in
+            zip(hist.abs_histogram.index, hist.abs_histogram.values)]
+
+@pytest.mark.parametrize("hist_class,ref_sizes", [
+    (CapSizeDerefHistogram, ref_deref_sizes),
+    (CapSizeBoundHistogram, ref_bound_sizes),
+])
+def test_histogram_bins(ptr_size_pgm, vmmap, hist_class, ref_sizes):
+    hist = hist_class(ptr_size_pgm, vmmap)
+    sizes = ref_sizes(ptr_size_pgm.prov_view(), vmmap)
+    expect = ref_histogram(hist, vmmap, sizes)
+    assert len(expect) > 0
+    assert histogram_rows(hist) == expect
+    for vm_entry, row in zip(hist.norm_histogram.index,
+                             hist.norm_histogram.values):
+        abs_row = hist.abs_histogram.loc[vm_entry].values
+        assert np.allclose(row, abs_row / np.sum(abs_row))
+
+@pytest.mark.parametrize("absolute", [False, True])
+def test_cdf(ptr_size_pgm, absolute):
+    cdf = PtrBoundCdf(ptr_size_pgm, absolute)
+    cdf.build_cdf()
+    # per-vertex reference
+    graph = ptr_size_pgm.prov_view()
+    ptr_sizes = [graph.vp.data[v].cap.length for v in graph.vertices()]
+    size_freq = sorted(Counter(ptr_sizes).items())
+    if absolute:
+        size_pdf = [count for _, count in size_freq]
+    else:
+        size_pdf = [count / len(ptr_sizes) for _, count in size_freq]
+    x = [0, size_freq[0][0]] + [size for size, _ in size_freq]
+    y = [0, 0] + list(np.cumsum(size_pdf))
+    assert np.allclose(cdf.size_cdf, np.column_stack((x, y)))
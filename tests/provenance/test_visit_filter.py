@@ -11,8 +11,9 @@ from cheriplot.provenance.model import (
     ProvenanceVertexData)
 
 from cheriplot.provenance.visit import (
-    FilterNullVertices, FilterKernelVertices, FilterCfromptr, MergeCfromptr,
-    BFSGraphVisit, ProvGraphTimeSlice)
+    FilterNullVertices, FilterKernelVertices, FilterCfromptr, FilterCandperm,
+    FilterRootVertices, MergeCfromptr, BFSGraphVisit, MaskBFSVisit,
+    ProvGraphTimeSlice)
 
 from tests.provenance.helper import (
     assert_graph_equal, MockGraphBuilder, model_cap)
@@ -382,3 +383,116 @@ def test_filter(mock_model, visitor_class, error):
     else:
         with pytest.raises(error):
             visitor(input_.graph)
+
+# test the vector filters on vertices with None capability fields
+# A -> B(kern, pc None)
+#   -> C(base/length None) -> D(kern, offset/length None)
+#   -> E(invalid, base None, pc None)
+# call-root
+graph_filter_none_fields = (
+    ("prov_node", {
+        "id": "A",
+        "origin": CheriNodeOrigin.ROOT,
+        "cap": model_cap(0x0, 0x0, 0x10000, rw_perm, t=0),
+        "pc": 0x1000,
+    }),
+    ("prov_node", {
+        "id": "B",
+        "origin": CheriNodeOrigin.SETBOUNDS,
+        "cap": model_cap(0x5000, 0x0, 0x100, rw_perm, t=5),
+        "is_kernel": True,
+        "pc": None,
+    }),
+    ("prov_node", {
+        "id": "C",
+        "origin": CheriNodeOrigin.FROMPTR,
+        "cap": model_cap(None, 0x0, None, rw_perm, t=10),
+        "pc": 0x2000,
+    }),
+    ("prov_node", {
+        "id": "D",
+        "origin": CheriNodeOrigin.ANDPERM,
+        "cap": model_cap(0x0, None, None, rw_perm, t=20),
+        "is_kernel": True,
+        "pc": 0,
+    }),
+    ("prov_node", {
+        "id": "E",
+        "origin": CheriNodeOrigin.SETBOUNDS,
+        "cap": model_cap(None, 0x0, 0x0, 0, t=25, valid=False),
+        "pc": None,
+    }),
+    ("prov_edge", "A", "B", {}),
+    ("prov_edge", "A", "C", {}),
+    ("prov_edge", "C", "D", {}),
+    ("prov_edge", "A", "E", {}),
+    ("call_node", {
+        "id": "call-root",
+        "addr": None,
+    }),
+)
+
+class RefFilterNullVertices(MaskBFSVisit):
+    """Per-vertex implementation of :class:`FilterNullVertices`."""
+
+    def examine_vertex(self, u):
+        if self.pgm.layer_prov[u]:
+            data = self.pgm.data[u]
+            if ((data.cap.length == 0 and data.cap.base == 0) or
+                not data.cap.valid):
+                self.vertex_mask[u] = False
+
+
+class RefFilterKernelVertices(MaskBFSVisit):
+    """Per-vertex implementation of :class:`FilterKernelVertices`."""
+
+    def examine_vertex(self, u):
+        if self.pgm.layer_prov[u]:
+            data = self.pgm.data[u]
+            if data.pc != 0 and data.is_kernel:
+                self.vertex_mask[u] = False
+
+
+class RefFilterOrigin(MaskBFSVisit):
+    """Per-vertex implementation of the filters by vertex origin."""
+
+    origins = ()
+
+    def examine_vertex(self, u):
+        if self.pgm.layer_prov[u]:
+            if self.pgm.data[u].origin in self.origins:
+                self.vertex_mask[u] = False
+
+
+class RefFilterCfromptr(RefFilterOrigin):
+    origins = (CheriNodeOrigin.FROMPTR,)
+
+
+class RefFilterCandperm(RefFilterOrigin):
+    origins = (CheriNodeOrigin.ANDPERM,)
+
+
+class RefFilterRootVertices(RefFilterOrigin):
+    origins = (CheriNodeOrigin.ROOT, CheriNodeOrigin.INITIAL_ROOT)
+
+
+@pytest.mark.timeout(4)
+@pytest.mark.parametrize("visitor_class, ref_class", [
+    (FilterNullVertices, RefFilterNullVertices),
+    (FilterKernelVertices, RefFilterKernelVertices),
+    (FilterCfromptr, RefFilterCfromptr),
+    (FilterCandperm, RefFilterCandperm),
+    (FilterRootVertices, RefFilterRootVertices),
+])
+def test_vector_filter_none_fields(visitor_class, ref_class):
+    """
+    Check that the vectorized filters mask the same vertices as
+    the per-vertex predicates when capability fields are None.
+    """
+    input_ = ProvenanceGraphManager("")
+    builder = MockGraphBuilder(ProvenanceGraphManager(""))
+    builder.build_graph(input_, graph_filter_none_fields)
+
+    expect_view = ref_class(input_)(input_.graph)
+    result_view = visitor_class(input_)(input_.graph)
+    assert list(result_view.get_vertices()) == list(expect_view.get_vertices())
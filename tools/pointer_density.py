@@ -34,8 +34,6 @@ This script produces a poiner provenance plot from a cheri trace file
 import argparse as ap
 import sys
 import logging
-import cProfile
-import pstats
 
 from cheriplot.plot import PointerDensityPlot
 from cheriplot.core.tool import PlotTool
@@ -34,8 +34,6 @@ This script plots the out-of-bound pointer manipulations.
 import argparse as ap
 import sys
 import logging
-import cProfile
-import pstats
 
 from cheriplot.plot import CapOutOfBoundPlot
 from cheriplot.core.tool import PlotTool